@@ -0,0 +1,66 @@
+"""
+Per-call overhead of the search backends used by mcp_search_bot.py.
+
+Usage:
+    python benchmarks/bench_backends.py [--calls N]
+
+Calls the network-free ``cache_stats`` tool through the stdio MCP subprocess
+and through InProcessSearchSession, so the difference is the cost of the
+JSON-RPC serialization, pipe and subprocess hop alone.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_mcp_adapters.client import MultiServerMCPClient  # noqa: E402
+
+from mcp_search_bot import InProcessSearchSession, SearchSessionPool, search_server_connection  # noqa: E402
+
+
+async def measure(session, calls: int) -> list:
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await session.call_tool("cache_stats", arguments={})
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:10} mean {statistics.mean(latencies):8.3f} ms   p50 {statistics.median(latencies):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    client = MultiServerMCPClient({"search": search_server_connection(ROOT)})
+    pool = SearchSessionPool(lambda index: client.session("search"))
+    if not await pool.start("search"):
+        print("search server did not start")
+        return
+    try:
+        await measure(pool, 10)  # warm-up
+        report("stdio", await measure(pool, args.calls))
+    finally:
+        await pool.close()
+
+    session = InProcessSearchSession()
+    try:
+        await measure(session, 10)
+        report("inprocess", await measure(session, args.calls))
+    finally:
+        await session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""
+CPU cost of result parsing as a function of max_results.
+
+Usage:
+    python benchmarks/bench_parse.py [--fixture FILE] [--iterations N]
+
+Every installed backend is run with early_stop on and off. With early_stop
+the cost should grow with max_results instead of staying at the cost of a
+full-page parse.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from search_server_duckduck_go import PARSERS  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "python_asyncio.html")
+
+
+def cpu_ms_per_parse(parser, content: bytes, max_results: int, iterations: int) -> float:
+    started = time.process_time()
+    for _ in range(iterations):
+        parser.parse(content, "utf-8", max_results)
+    return (time.process_time() - started) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", default=FIXTURE)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--max-results", type=int, nargs="+", default=[1, 3, 5, 10])
+    args = parser.parse_args()
+
+    with open(args.fixture, "rb") as f:
+        content = f.read()
+
+    header = " ".join(f"{'max=' + str(n):>9}" for n in args.max_results)
+    print(f"CPU ms per parse of {os.path.basename(args.fixture)} ({len(content)} bytes)")
+    print(f"{'backend':12} {'early_stop':>10} {header}")
+    for name, parser_cls in PARSERS.items():
+        for early_stop in (False, True):
+            try:
+                backend = parser_cls(early_stop)
+            except ImportError:
+                print(f"{name:12} not installed")
+                break
+            timings = " ".join(
+                f"{cpu_ms_per_parse(backend, content, n, args.iterations):>9.3f}"
+                for n in args.max_results
+            )
+            print(f"{name:12} {str(early_stop):>10} {timings}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark for RateLimiter.acquire under many concurrent waiters.
+
+Usage:
+    python benchmarks/bench_rate_limiter.py [--waiters 100 1000 10000]
+
+Two scenarios are measured for each waiter count:
+  * uncontended - the bucket holds enough tokens for everyone, so the cost
+    is pure limiter bookkeeping;
+  * saturated - the bucket starts empty and refills at a fixed rate, so every
+    waiter queues (the burst only absorbs event loop timer granularity); the
+    limiter overhead is the wall time above the ideal ``waiters / rate`` and
+    completion order must match arrival order (FIFO).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from search_server_duckduck_go import RateLimiter  # noqa: E402
+
+
+async def run_uncontended(waiters: int) -> float:
+    limiter = RateLimiter(requests_per_minute=60 * 10**9, burst=waiters)
+    started = time.perf_counter()
+    await asyncio.gather(*(limiter.acquire() for _ in range(waiters)))
+    return time.perf_counter() - started
+
+
+async def run_saturated(waiters: int, rate_per_second: float, burst: int):
+    limiter = RateLimiter(requests_per_minute=int(rate_per_second * 60), burst=burst)
+    for _ in range(burst):  # start with an empty bucket
+        await limiter.acquire()
+    order = []
+
+    async def waiter(i: int):
+        await limiter.acquire()
+        order.append(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(waiter(i) for i in range(waiters)))
+    elapsed = time.perf_counter() - started
+    return elapsed, order == sorted(order)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--waiters", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--rate", type=float, default=20000.0, help="refill rate for the saturated run, tokens/s")
+    parser.add_argument("--burst", type=int, default=100, help="bucket size for the saturated run")
+    args = parser.parse_args()
+
+    print(f"{'waiters':>8} {'uncontended us/acquire':>24} {'saturated overhead us/acquire':>30} {'fifo':>5}")
+    for waiters in args.waiters:
+        uncontended = await run_uncontended(waiters)
+        saturated, fifo = await run_saturated(waiters, args.rate, args.burst)
+        overhead = max(saturated - waiters / args.rate, 0.0)
+        print(
+            f"{waiters:>8} {uncontended / waiters * 1e6:>24.2f} "
+            f"{overhead / waiters * 1e6:>30.2f} {str(fifo):>5}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
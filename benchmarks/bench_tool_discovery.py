@@ -0,0 +1,70 @@
+"""
+Round trips saved by caching tool discovery in call_search_tool.
+
+Usage:
+    python benchmarks/bench_tool_discovery.py [--queries N]
+
+Replays N "queries" against a stdio search server. The uncached path runs
+list_tools before every call_tool, as call_search_tool used to; the cached
+path resolves the tool list once through resolve_tools. The network-free
+cache_stats tool stands in for search, so only MCP round trips are timed.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_mcp_adapters.client import MultiServerMCPClient  # noqa: E402
+
+from mcp_search_bot import SearchSessionPool, invalidate_tools, resolve_tools, search_server_connection  # noqa: E402
+
+
+async def uncached(session, queries: int) -> float:
+    started = time.perf_counter()
+    for _ in range(queries):
+        list_tools_result = await session.list_tools()
+        assert any(tool.name == "cache_stats" for tool in list_tools_result.tools)
+        await session.call_tool("cache_stats", arguments={})
+    return time.perf_counter() - started
+
+
+async def cached(session, queries: int) -> float:
+    invalidate_tools(session)
+    started = time.perf_counter()
+    for _ in range(queries):
+        tools = await resolve_tools(session)
+        assert "cache_stats" in tools
+        await session.call_tool("cache_stats", arguments={})
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    client = MultiServerMCPClient({"search": search_server_connection(ROOT)})
+    pool = SearchSessionPool(lambda index: client.session("search"))
+    if not await pool.start("search"):
+        print("search server did not start")
+        return
+    try:
+        await uncached(pool, 10)  # warm-up
+        before = await uncached(pool, args.queries)
+        after = await cached(pool, args.queries)
+    finally:
+        await pool.close()
+
+    per_query_before = before / args.queries * 1000
+    per_query_after = after / args.queries * 1000
+    print(f"list_tools + call_tool per query: {per_query_before:.3f} ms (2 round trips)")
+    print(f"cached tools + call_tool:         {per_query_after:.3f} ms (1 round trip)")
+    print(f"saved per query:                  {per_query_before - per_query_after:.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+"""
+Update delivery latency of the bot in polling and webhook mode.
+
+Usage:
+    python benchmarks/bench_update_modes.py [--updates N] [--burst N] [--modes polling webhook]
+
+Starts a local fake Bot API (starlette + uvicorn) and runs mcp_search_bot.py
+against it through TELEGRAM_API_BASE_URL with SEARCH_BACKEND=inprocess. Each
+update is a /start command from its own chat; the time from handing the
+update to "Telegram" (queued for getUpdates or POSTed to the webhook) to the
+bot's sendMessage reply is the delivery latency. The burst run hands over
+all updates at once and reports the time until the last reply.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import time
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+TOKEN = "123456:bench"
+SECRET = "bench-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeBotApi:
+    """Just enough of the Bot API for Application.initialize, polling, webhooks and replies."""
+
+    def __init__(self):
+        self.updates = []
+        self.next_update_id = 1
+        self.new_update = asyncio.Event()
+        self.polling = asyncio.Event()
+        self.webhook_set = asyncio.Event()
+        self.replies = {}
+        self.reply_event = asyncio.Event()
+        self.app = Starlette(routes=[Route("/bot{token}/{method}", self.handle, methods=["GET", "POST"])])
+
+    def make_update(self, chat_id: int) -> dict:
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        user = {"id": chat_id, "is_bot": False, "first_name": "bench"}
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": user,
+                "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+
+    def enqueue(self, update: dict):
+        self.updates.append(update)
+        self.new_update.set()
+
+    async def params(self, request: Request) -> dict:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            return await request.json()
+        return dict(await request.form())
+
+    async def handle(self, request: Request):
+        method = request.path_params["method"]
+        params = await self.params(request)
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method == "getUpdates":
+            result = await self.get_updates(int(params.get("offset") or 0), float(params.get("timeout") or 0))
+        elif method == "setWebhook":
+            self.webhook_set.set()
+            result = True
+        elif method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self.replies[chat_id] = time.perf_counter()
+            self.reply_event.set()
+            result = {
+                "message_id": len(self.replies),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return JSONResponse({"ok": True, "result": result})
+
+    async def get_updates(self, offset: int, timeout: float) -> list:
+        self.polling.set()
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)
+
+    async def wait_replies(self, chat_ids, timeout: float = 30.0):
+        deadline = time.perf_counter() + timeout
+        while not all(chat_id in self.replies for chat_id in chat_ids):
+            self.reply_event.clear()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError("bot did not reply")
+            try:
+                await asyncio.wait_for(self.reply_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def deliver(mode: str, api: FakeBotApi, client: httpx.AsyncClient, webhook: str, chat_id: int) -> float:
+    update = api.make_update(chat_id)
+    started = time.perf_counter()
+    if mode == "polling":
+        api.enqueue(update)
+    else:
+        response = await client.post(webhook, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+        response.raise_for_status()
+    return started
+
+
+async def run_mode(mode: str, api: FakeBotApi, api_port: int, updates: int, burst: int):
+    webhook_port = free_port()
+    webhook = f"http://127.0.0.1:{webhook_port}/telegram"
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_MODE=mode,
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{api_port}/bot",
+        SEARCH_BACKEND="inprocess",
+        WEBHOOK_URL=webhook,
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_SECRET=SECRET,
+    )
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "mcp_search_bot.py"), env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    api.polling.clear()
+    api.webhook_set.clear()
+    api.replies.clear()
+    chat_id = 1000
+    try:
+        async with httpx.AsyncClient() as client:
+            ready = api.polling if mode == "polling" else api.webhook_set
+            await asyncio.wait_for(ready.wait(), 30)
+            if mode == "webhook":
+                # setWebhook is sent before the listener is fully up
+                for _ in range(100):
+                    try:
+                        rejected = await client.post(webhook, json=api.make_update(1), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+                        break
+                    except httpx.TransportError:
+                        await asyncio.sleep(0.05)
+                print(f"webhook with a wrong secret token: HTTP {rejected.status_code}")
+
+            latencies = []
+            for _ in range(updates):
+                chat_id += 1
+                started = await deliver(mode, api, client, webhook, chat_id)
+                await api.wait_replies([chat_id])
+                latencies.append((api.replies[chat_id] - started) * 1000)
+
+            chat_ids = list(range(chat_id + 1, chat_id + 1 + burst))
+            started = time.perf_counter()
+            await asyncio.gather(*(deliver(mode, api, client, webhook, c) for c in chat_ids))
+            await api.wait_replies(chat_ids)
+            burst_seconds = time.perf_counter() - started
+    finally:
+        process.terminate()
+        await process.wait()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{mode:8} p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms   "
+        f"burst of {burst}: {burst_seconds * 1000:8.1f} ms ({burst / burst_seconds:.0f} updates/s)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=200)
+    parser.add_argument("--modes", nargs="+", default=["polling", "webhook"], choices=["polling", "webhook"])
+    args = parser.parse_args()
+
+    api = FakeBotApi()
+    api_port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=api_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        for mode in args.modes:
+            if mode == "webhook":
+                try:
+                    import tornado  # noqa: F401  (python-telegram-bot[webhooks])
+                except ImportError:
+                    print("skip webhook: install python-telegram-bot[webhooks]")
+                    continue
+            await run_mode(mode, api, api_port, args.updates, args.burst)
+    finally:
+        server.should_exit = True
+        await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
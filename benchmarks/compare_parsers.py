@@ -0,0 +1,60 @@
+"""
+Check that every installed result parser backend matches the BeautifulSoup
+fallback on the fixture corpus, including the next-page form parameters.
+
+Usage:
+    python benchmarks/compare_parsers.py [--fixtures DIR] [--max-results N]
+
+Exits with status 1 if any backend produces a different ParsedPage.
+"""
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from search_server_duckduck_go import PARSERS, SoupResultParser  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--max-results", type=int, nargs="+", default=[1, 3, 10, 100])
+    args = parser.parse_args()
+
+    backends = []
+    for name, parser_cls in PARSERS.items():
+        try:
+            backends.append(parser_cls())
+        except ImportError:
+            print(f"skip {name}: not installed")
+
+    reference = SoupResultParser()
+    failures = 0
+    for path in sorted(glob.glob(os.path.join(args.fixtures, "*.html"))):
+        with open(path, "rb") as f:
+            content = f.read()
+        for max_results in args.max_results:
+            expected = reference.parse(content, "utf-8", max_results)
+            for backend in backends:
+                actual = backend.parse(content, "utf-8", max_results)
+                status = "ok" if actual == expected else "MISMATCH"
+                if actual != expected:
+                    failures += 1
+                print(f"{status:8} {backend.name:11} max_results={max_results:<4} {os.path.basename(path)} ({len(actual.results)} results)")
+                if actual != expected:
+                    for want, got in zip(expected.results, actual.results):
+                        if want != got:
+                            print(f"    expected {want}\n    got      {got}")
+                            break
+                    if expected.next_params != actual.next_params:
+                        print(f"    expected next page {expected.next_params}\n    got               {actual.next_params}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Local stand-in for html.duckduckgo.com for load and soak tests.
+
+Usage:
+    python benchmarks/ddg_stub.py [--port 8765] [--latency MS] [--jitter MS]
+                                  [--error-rate P] [--anomaly-rate P] [--max-rps N]
+
+Serves the (synthetic) pages in fixtures/ at /html (GET or POST, like the real
+endpoint): a query is mapped to one of the first-page fixtures by hash, and
+a request with a non-zero ``s`` offset gets <fixture>_page2.html (or the
+empty results page). Point the search server at it with
+DDG_BASE_URL=http://127.0.0.1:8765/html.
+
+Faults:
+    --latency/--jitter  response delay in milliseconds, uniform in latency +- jitter
+    --error-rate        fraction of requests answered with HTTP 500
+    --anomaly-rate      fraction answered with HTTP 202 and the bot-check
+                        ("anomaly") page DuckDuckGo serves to suspected bots
+    --max-rps           requests per second above which the stub answers with
+                        the anomaly page, as DuckDuckGo does when throttling
+
+Counters are available as JSON at /stats.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import random
+import time
+import zlib
+from typing import Dict, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures")
+
+ANOMALY_PAGE = b"""<!DOCTYPE html>
+<html><head><title>DuckDuckGo</title></head>
+<body><div class="anomaly-modal__title">Unfortunately, bots use DuckDuckGo too.</div>
+<div class="anomaly-modal__description">Please complete the following challenge to confirm this search was made by a human.</div>
+</body></html>
+"""
+
+
+class DuckDuckGoStub:
+    def __init__(
+        self,
+        fixtures_dir: str = FIXTURES_DIR,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        anomaly_rate: float = 0.0,
+        max_rps: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.pages: Dict[str, bytes] = {}
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))):
+            with open(path, "rb") as f:
+                self.pages[os.path.splitext(os.path.basename(path))[0]] = f.read()
+        self.first_pages = [
+            name for name in self.pages if not name.endswith("_page2") and name != "no_results"
+        ]
+        if not self.first_pages:
+            raise ValueError(f"no result pages in {fixtures_dir}")
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.anomaly_rate = anomaly_rate
+        self.max_rps = max_rps
+        self.random = random.Random(seed)
+        self._tokens = max_rps
+        self._updated = time.monotonic()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "anomalies": 0, "throttled": 0}
+        self.app = Starlette(
+            routes=[
+                Route("/html", self.html, methods=["GET", "POST"]),
+                Route("/html/", self.html, methods=["GET", "POST"]),
+                Route("/stats", self.get_stats),
+            ]
+        )
+
+    def _throttled(self) -> bool:
+        if self.max_rps <= 0:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.max_rps, self._tokens + (now - self._updated) * self.max_rps)
+        self._updated = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    def page_for(self, query: str, offset: int) -> bytes:
+        name = self.first_pages[zlib.crc32(query.encode()) % len(self.first_pages)]
+        if offset > 0:
+            name = f"{name}_page2"
+        return self.pages.get(name, self.pages.get("no_results", b""))
+
+    async def html(self, request: Request) -> Response:
+        self.stats["requests"] += 1
+        throttled = self._throttled()
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        params = dict(request.query_params)
+        if request.method == "POST":
+            params.update(await request.form())
+
+        if throttled:
+            self.stats["throttled"] += 1
+            return Response(ANOMALY_PAGE, status_code=202, media_type="text/html; charset=utf-8")
+        roll = self.random.random()
+        if roll < self.error_rate:
+            self.stats["errors"] += 1
+            return Response(b"Internal Server Error", status_code=500)
+        if roll < self.error_rate + self.anomaly_rate:
+            self.stats["anomalies"] += 1
+            return Response(ANOMALY_PAGE, status_code=202, media_type="text/html; charset=utf-8")
+
+        try:
+            offset = int(params.get("s") or 0)
+        except ValueError:
+            offset = 0
+        self.stats["ok"] += 1
+        return Response(self.page_for(params.get("q", ""), offset), media_type="text/html; charset=utf-8")
+
+    async def get_stats(self, request: Request) -> JSONResponse:
+        return JSONResponse(self.stats)
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response delay, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+- delay spread, ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--anomaly-rate", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=float, default=0.0, help="0 = unlimited")
+    parser.add_argument("--seed", type=int)
+
+
+def stub_from_args(args: argparse.Namespace) -> DuckDuckGoStub:
+    return DuckDuckGoStub(
+        args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        anomaly_rate=args.anomaly_rate,
+        max_rps=args.max_rps,
+        seed=args.seed,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    stub = stub_from_args(args)
+    print(f"DuckDuckGo stub on http://{args.host}:{args.port}/html ({len(stub.pages)} fixture pages)")
+    uvicorn.run(stub.app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Load and soak test of the search stack against the local DuckDuckGo stub.
+
+Usage:
+    python benchmarks/load_test.py [--target mcp|direct] [--duration S] [--concurrency N]
+                                   [--stub-url URL] [stub fault options, see ddg_stub.py]
+
+Starts benchmarks/ddg_stub.py (unless --stub-url is given) and keeps
+--concurrency searches in flight for --duration seconds, every one with a
+unique query so that each goes through the rate limiter, the HTTP pool and
+the parser instead of the cache.
+
+    mcp     search_server_duckduck_go.py runs as a streamable HTTP server
+            (DDG_BASE_URL pointing at the stub, rate limiting off) and the
+            load goes through --sessions MCP client sessions
+    direct  a DuckDuckGoSearcher in this process talks to the stub, which
+            measures the searcher alone, without MCP
+
+Prints throughput, latency percentiles and the outcome counts of the tool
+and of the stub.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_update_modes import free_port  # noqa: E402
+from ddg_stub import add_fault_arguments  # noqa: E402
+from suite import NullContext, percentiles  # noqa: E402
+
+
+async def wait_http(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+def classify(text: str) -> str:
+    if text.startswith("Found "):
+        return "results"
+    if text.startswith("No results"):
+        return "empty"
+    return "error"
+
+
+async def drive(call, duration: float, concurrency: int) -> tuple:
+    counter = itertools.count()
+    latencies = []
+    outcomes = {"results": 0, "empty": 0, "error": 0}
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            query = f"load test query {next(counter)}"
+            started = time.perf_counter()
+            try:
+                outcome = classify(await call(query))
+            except Exception:
+                outcome = "error"
+            latencies.append((time.perf_counter() - started) * 1000)
+            outcomes[outcome] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, outcomes, time.perf_counter() - started
+
+
+async def run_direct(args, stub_url: str) -> tuple:
+    from search_server_duckduck_go import DuckDuckGoSearcher, RateLimiter, SearchCache
+
+    searcher = DuckDuckGoSearcher(
+        max_connections=args.concurrency,
+        max_keepalive_connections=args.concurrency,
+        rate_limiter=RateLimiter(requests_per_minute=0),
+        cache=SearchCache(max_entries=16),
+        base_url=stub_url,
+    )
+    ctx = NullContext()
+
+    async def call(query: str) -> str:
+        return searcher.render(await searcher.search(query, ctx))
+
+    try:
+        return await drive(call, args.duration, args.concurrency)
+    finally:
+        await searcher.aclose()
+
+
+async def run_mcp(args, stub_url: str) -> tuple:
+    from contextlib import AsyncExitStack
+
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        DDG_BASE_URL=stub_url,
+        DDG_REQUESTS_PER_MINUTE="0",
+        DDG_MAX_CONNECTIONS=str(args.concurrency),
+        DDG_MAX_KEEPALIVE_CONNECTIONS=str(args.concurrency),
+    )
+    env.pop("DDG_CACHE_DB", None)
+    server = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "search_server_duckduck_go.py"),
+        "--transport", "streamable-http", "--port", str(port), env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/mcp"
+    try:
+        await wait_http(url)
+        async with AsyncExitStack() as stack:
+            sessions = []
+            for _ in range(args.sessions):
+                read, write, _ = await stack.enter_async_context(streamablehttp_client(url))
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+                sessions.append(session)
+            rotation = itertools.cycle(sessions)
+
+            async def call(query: str) -> str:
+                result = await next(rotation).call_tool("search", {"query": query})
+                return result.content[0].text if result.content else ""
+
+            return await drive(call, args.duration, args.concurrency)
+    finally:
+        server.terminate()
+        await server.wait()
+
+
+def report(latencies: list, outcomes: dict, elapsed: float):
+    print(f"searches: {len(latencies)} in {elapsed:.1f} s = {len(latencies) / elapsed:.0f} searches/s")
+    if latencies:
+        stats = percentiles(latencies)
+        print(
+            f"latency:  mean {stats['mean_ms']:.2f} ms  p50 {stats['p50_ms']:.2f} ms  "
+            f"p95 {stats['p95_ms']:.2f} ms  p99 {stats['p99_ms']:.2f} ms  max {max(latencies):.2f} ms"
+        )
+    print("outcomes: " + "  ".join(f"{name} {count}" for name, count in outcomes.items()))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["mcp", "direct"], default="mcp")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sessions", type=int, default=4, help="MCP client sessions (target mcp)")
+    parser.add_argument("--stub-url", help="use an already running stub instead of starting one")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    # Per-request httpx log lines would cost more than the requests themselves
+    logging.disable(logging.INFO)
+
+    stub = None
+    stub_url = args.stub_url
+    if not stub_url:
+        port = free_port()
+        command = [
+            os.path.join(BENCH_DIR, "ddg_stub.py"), "--port", str(port), "--fixtures", args.fixtures,
+            "--latency", str(args.latency), "--jitter", str(args.jitter),
+            "--error-rate", str(args.error_rate), "--anomaly-rate", str(args.anomaly_rate),
+            "--max-rps", str(args.max_rps),
+        ]
+        if args.seed is not None:
+            command += ["--seed", str(args.seed)]
+        stub = await asyncio.create_subprocess_exec(sys.executable, *command, stdout=asyncio.subprocess.DEVNULL)
+        stub_url = f"http://127.0.0.1:{port}/html"
+    try:
+        await wait_http(stub_url.rsplit("/html", 1)[0] + "/stats")
+        run = run_mcp if args.target == "mcp" else run_direct
+        report(*await run(args, stub_url))
+        async with httpx.AsyncClient() as client:
+            stats = (await client.get(stub_url.rsplit("/html", 1)[0] + "/stats")).json()
+        print("stub:     " + "  ".join(f"{name} {count}" for name, count in stats.items()))
+    finally:
+        if stub is not None:
+            stub.terminate()
+            await stub.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Record DuckDuckGo result pages into the offline fixture corpus.
+
+Usage:
+    python benchmarks/record_fixtures.py QUERY [QUERY ...] [--pages N] [--fixtures DIR]
+
+Saves the first page of every query as fixtures/<name>.html and, with
+--pages 2, the following page as fixtures/<name>_page2.html (the layout
+suite.py serves for paginated searches). <name> is the query with
+non-alphanumeric characters replaced by underscores. This is the only
+benchmark script that needs network access.
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from search_server_duckduck_go import DuckDuckGoSearcher, RateLimiter, make_parser  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures")
+
+
+def fixture_name(query: str) -> str:
+    return re.sub(r"\W+", "_", query.casefold()).strip("_")
+
+
+async def record(client: httpx.AsyncClient, limiter: RateLimiter, query: str, pages: int, fixtures_dir: str):
+    parser = make_parser("bs4")
+    data = {"q": query, "b": "", "kl": ""}
+    name = fixture_name(query)
+    for page in range(1, pages + 1):
+        await limiter.acquire()
+        response = await client.post(DuckDuckGoSearcher.BASE_URL, data=data)
+        response.raise_for_status()
+        path = os.path.join(fixtures_dir, f"{name}.html" if page == 1 else f"{name}_page{page}.html")
+        with open(path, "wb") as f:
+            f.write(response.content)
+        parsed = parser.parse(response.content, response.encoding, 100)
+        print(f"{path}: {len(response.content)} bytes, {len(parsed.results)} results")
+        if not parsed.next_params:
+            break
+        data = parsed.next_params
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="+")
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.fixtures, exist_ok=True)
+    # Stay well below the rate that gets the client blocked
+    limiter = RateLimiter(requests_per_minute=10, burst=1)
+    async with httpx.AsyncClient(headers=DuckDuckGoSearcher.HEADERS, timeout=30.0) as client:
+        for query in args.queries:
+            await record(client, limiter, query, args.pages, args.fixtures)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,352 @@
+"""
+Offline benchmark suite over the DuckDuckGo result pages in fixtures/.
+
+Usage:
+    python benchmarks/suite.py [--output FILE] [--compare BASELINE.json] [--quick]
+
+Measures:
+    parse   pages/s and MB/s of every installed parser backend over the corpus
+    format  microseconds per call of every output format
+    alloc   tracemalloc peak KiB of one parse, one format call and one search
+    search  p50/p95/p99 latency of the search tool, called directly and over
+            an in-memory MCP session; DuckDuckGo is replaced by an
+            httpx.MockTransport that serves the fixtures, so every search
+            runs the full cache-miss path without touching the network
+
+Results are written as JSON (default benchmarks/results/<timestamp>.json).
+With --compare the run is printed next to an earlier results file, with the
+relative change of every metric.
+
+The bundled fixtures are synthetic: hand-built pages in the layout of the
+DuckDuckGo HTML endpoint (they share a placeholder vqd token), not captures
+of real result pages, so parse and search numbers over them are not
+real-page throughput. Real pages can be recorded with
+benchmarks/record_fixtures.py and passed with --fixtures.
+"""
+import argparse
+import asyncio
+import gc
+import glob
+import html
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import search_server_duckduck_go as server  # noqa: E402
+from search_server_duckduck_go import (  # noqa: E402
+    OUTPUT_FORMATS,
+    PARSERS,
+    DuckDuckGoSearcher,
+    RateLimiter,
+    SearchCache,
+    make_parser,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "results")
+
+
+class NullContext:
+    """Stands in for the MCP Context when the tool functions are called directly."""
+
+    async def debug(self, message: str, **extra):
+        pass
+
+    async def info(self, message: str, **extra):
+        pass
+
+    async def warning(self, message: str, **extra):
+        pass
+
+    async def error(self, message: str, **extra):
+        pass
+
+    async def report_progress(self, progress, total=None, message=None):
+        pass
+
+
+def load_corpus(fixtures_dir: str) -> dict:
+    corpus = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))):
+        with open(path, "rb") as f:
+            corpus[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    if not corpus:
+        sys.exit(f"no fixtures in {fixtures_dir}")
+    return corpus
+
+
+def fixture_transport(corpus: dict) -> httpx.MockTransport:
+    """Serve "<fixture> <n>" queries from <fixture>.html and later pages from <fixture>_page2.html.
+
+    Later-page requests carry the q of the fixture's own next-page form
+    rather than the search query, so they are mapped back by that value.
+    """
+    next_page_fixtures = {}
+    for name, content in corpus.items():
+        match = re.search(rb'name="q" value="([^"]*)"', content)
+        if match and not name.endswith("_page2"):
+            next_page_fixtures[html.unescape(match.group(1).decode("utf-8"))] = name
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        form = dict(httpx.QueryParams(request.content.decode()))
+        query = form.get("q", "")
+        name = query.split(" ")[0]
+        if form.get("s"):
+            name = f"{next_page_fixtures.get(query, name)}_page2"
+        content = corpus.get(name, corpus.get("no_results", b""))
+        return httpx.Response(200, content=content, headers={"content-type": "text/html; charset=utf-8"})
+
+    return httpx.MockTransport(handler)
+
+
+def percentiles(latencies: list) -> dict:
+    latencies = sorted(latencies)
+
+    def rank(p: float) -> float:
+        return latencies[min(len(latencies) - 1, max(0, int(round(p / 100 * len(latencies))) - 1))]
+
+    return {
+        "n": len(latencies),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": rank(50),
+        "p95_ms": rank(95),
+        "p99_ms": rank(99),
+    }
+
+
+def bench_parse(corpus: dict, seconds: float) -> dict:
+    results = {}
+    total_bytes = sum(len(content) for content in corpus.values())
+    for name, parser_cls in PARSERS.items():
+        try:
+            parser = parser_cls()
+        except ImportError:
+            continue
+        pages = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            for content in corpus.values():
+                parser.parse(content, "utf-8", 10)
+            pages += len(corpus)
+        elapsed = time.perf_counter() - started
+        rounds = pages / len(corpus)
+        results[name] = {
+            "pages_per_s": pages / elapsed,
+            "mb_per_s": total_bytes * rounds / elapsed / 1e6,
+        }
+    return results
+
+
+def sample_results(corpus: dict) -> list:
+    parser = make_parser("bs4")
+    results = []
+    for content in corpus.values():
+        results.extend(parser.parse(content, "utf-8", 100).results)
+    return results[:10]
+
+
+def bench_format(searcher: DuckDuckGoSearcher, results: list, iterations: int) -> dict:
+    timings = {}
+    for output_format in OUTPUT_FORMATS:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            searcher.render(results, output_format)
+        timings[output_format] = {"us_per_call": (time.perf_counter() - started) / iterations * 1e6}
+    return timings
+
+
+def peak_kib(fn, repeat: int = 3) -> float:
+    """Smallest traced peak over a few calls, so a stray GC pass does not skew it"""
+    peaks = []
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn()
+        peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+    return min(peaks)
+
+
+def bench_alloc(corpus: dict, searcher: DuckDuckGoSearcher, results: list) -> dict:
+    content = max(corpus.values(), key=len)
+    tracemalloc.start()
+    try:
+        allocations = {}
+        for name, parser_cls in PARSERS.items():
+            try:
+                parser = parser_cls()
+            except ImportError:
+                continue
+            parser.parse(content, "utf-8", 10)  # warm-up: imports and compiled selectors
+            allocations[f"parse_{name}"] = {"peak_kib": peak_kib(lambda: parser.parse(content, "utf-8", 10))}
+        for output_format in OUTPUT_FORMATS:
+            allocations[f"format_{output_format}"] = {
+                "peak_kib": peak_kib(lambda: searcher.render(results, output_format))
+            }
+        allocations["search"] = {"peak_kib": asyncio.run(search_peak_kib(corpus))}
+    finally:
+        tracemalloc.stop()
+    return allocations
+
+
+async def search_peak_kib(corpus: dict) -> float:
+    # Measured inside one running loop so event loop setup is not counted
+    ctx = NullContext()
+    name = max((name for name in corpus if not name.endswith("_page2")), key=lambda n: len(corpus[n]))
+    await server.search(f"{name} warm-up", ctx)
+    peaks = []
+    for i in range(3):
+        gc.collect()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        await server.search(f"{name} alloc {i}", ctx)
+        peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+    return min(peaks)
+
+
+async def bench_search(fixtures: list, queries: int, max_results: int) -> dict:
+    ctx = NullContext()
+    names = [name for name in fixtures if not name.endswith("_page2")]
+
+    async def direct(i: int):
+        await server.search(f"{names[i % len(names)]} direct {i}", ctx, max_results)
+
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    for i in range(10):  # warm-up: HTTP client, parser selectors
+        await server.search(f"{names[i % len(names)]} warm-up {i}", ctx, max_results)
+
+    timings = {}
+    latencies = []
+    for i in range(queries):
+        started = time.perf_counter()
+        await direct(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    timings["direct"] = percentiles(latencies)
+
+    async with create_connected_server_and_client_session(server.mcp._mcp_server) as session:
+        latencies = []
+        for i in range(queries):
+            query = f"{names[i % len(names)]} mcp {i}"
+            started = time.perf_counter()
+            await session.call_tool("search", {"query": query, "max_results": max_results})
+            latencies.append((time.perf_counter() - started) * 1000)
+        timings["mcp"] = percentiles(latencies)
+    return timings
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not key == "n":
+            flat[path] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict):
+    print(f"\n{'metric':40} {'baseline':>12} {'current':>12} {'change':>9}")
+    old, new = flatten(baseline), flatten(current)
+    for path in sorted(set(old) | set(new)):
+        if path not in old or path not in new:
+            print(f"{path:40} {old.get(path, '-'):>12} {new.get(path, '-'):>12}")
+            continue
+        change = (new[path] - old[path]) / old[path] * 100 if old[path] else 0.0
+        better = change > 0 if path.endswith("_per_s") else change < 0
+        verdict = "better" if better and abs(change) >= 5 else "worse" if abs(change) >= 5 else ""
+        print(f"{path:40} {old[path]:>12.3f} {new[path]:>12.3f} {change:>+8.1f}% {verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--queries", type=int, default=500, help="searches per latency scenario")
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--quick", action="store_true", help="short run for a smoke test")
+    args = parser.parse_args()
+
+    # Per-request log lines from httpx and the MCP server would dominate the timings
+    logging.disable(logging.INFO)
+    corpus = load_corpus(args.fixtures)
+    parse_seconds, format_iterations, queries = (2.0, 2000, args.queries)
+    if args.quick:
+        parse_seconds, format_iterations, queries = (0.2, 200, 50)
+
+    # The tool functions use the module-level searcher; point it at the fixtures
+    searcher = DuckDuckGoSearcher(
+        rate_limiter=RateLimiter(requests_per_minute=0),
+        cache=SearchCache(),
+        transport=fixture_transport(corpus),
+    )
+    server.searcher = searcher
+    results = sample_results(corpus)
+
+    run = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parser": searcher.parser.name,
+            "fixtures": sorted(corpus),
+        },
+        "parse": bench_parse(corpus, parse_seconds),
+        "format": bench_format(searcher, results, format_iterations),
+        "alloc": bench_alloc(corpus, searcher, results),
+        "search": asyncio.run(bench_search(sorted(corpus), queries, args.max_results)),
+    }
+    asyncio.run(searcher.aclose())
+
+    for backend, metrics in run["parse"].items():
+        print(f"parse   {backend:11} {metrics['pages_per_s']:9.0f} pages/s {metrics['mb_per_s']:8.1f} MB/s")
+    for output_format, metrics in run["format"].items():
+        print(f"format  {output_format:11} {metrics['us_per_call']:9.1f} us/call")
+    for name, metrics in run["alloc"].items():
+        print(f"alloc   {name:18} {metrics['peak_kib']:9.1f} KiB peak")
+    for name, metrics in run["search"].items():
+        print(
+            f"search  {name:11} p50 {metrics['p50_ms']:7.3f} ms  p95 {metrics['p95_ms']:7.3f} ms  "
+            f"p99 {metrics['p99_ms']:7.3f} ms"
+        )
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2, ensure_ascii=False)
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), run)
+
+
+if __name__ == "__main__":
+    main()
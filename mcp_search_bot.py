@@ -1,15 +1,51 @@
 import os
+import json
+import time
+import inspect
 import asyncio
-from datetime import datetime
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import secrets
+from urllib.parse import urlparse
+from collections import OrderedDict
+from contextlib import AsyncExitStack, contextmanager
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional, Tuple
+import weakref
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.ext import (
+    Application,
+    BaseUpdateProcessor,
+    CommandHandler,
+    ContextTypes,
+    InlineQueryHandler,
+    MessageHandler,
+    filters,
+)
 from dotenv import load_dotenv
+import httpx
 
 # Импортируем необходимые классы и функции из mcp-client-2.py
-from mcp.types import Tool, TextContent
+from mcp import types
+from mcp.types import Tool, TextContent, CallToolResult, ListToolsResult
 from mcp import ClientSession
 from langchain_mcp_adapters.client import MultiServerMCPClient
 
+from report_store import ReportIndex, ReportWriter, open_report_store
+from telemetry import REGISTRY, serve_metrics
+from tracing import close_export, configure_export, configure_logging, current_trace, new_trace_id, span, trace
+
+# Время этапов обработки запроса в боте; отдаётся на BOT_METRICS_PORT
+STAGE_SECONDS = REGISTRY.histogram(
+    "bot_stage_seconds", "Время этапов обработки запроса (mcp_call, report_submit, telegram_reply)"
+)
+SEARCHES = REGISTRY.counter("bot_searches_total", "Запросы пользователей по исходу")
+
+
+@contextmanager
+def _stage(name: str):
+    """Этап обработки: и в гистограмму STAGE_SECONDS, и в текущую трассировку"""
+    with STAGE_SECONDS.time(stage=name), span(name):
+        yield
+
+
 # --- Подавление логов и предупреждений ---
 import logging
 
@@ -25,13 +61,266 @@ async def check_server_ready(session: ClientSession, server_name: str, timeout:
         return False
 
 
-async def call_search_tool(search_session: ClientSession, query: str) -> str:
+# --- Кэш списка инструментов: list_tools один раз на сессию, а не на каждый запрос ---
+_tools_cache: "weakref.WeakKeyDictionary[Any, Dict[str, Tool]]" = weakref.WeakKeyDictionary()
+# Запущенные list_tools: одновременные первые запросы ждут один и тот же вызов
+_tools_pending: "weakref.WeakKeyDictionary[Any, asyncio.Task]" = weakref.WeakKeyDictionary()
+
+
+async def _fetch_tools(search_session) -> Dict[str, Tool]:
+    list_tools_result = await search_session.list_tools()
+    tools = {tool.name: tool for tool in list_tools_result.tools}
+    # Если кэш сбросили, пока шёл вызов, результат уже может быть устаревшим
+    if _tools_pending.get(search_session) is asyncio.current_task():
+        _tools_cache[search_session] = tools
+        del _tools_pending[search_session]
+    return tools
+
+
+async def resolve_tools(search_session) -> Dict[str, Tool]:
+    tools = _tools_cache.get(search_session)
+    if tools is not None:
+        return tools
+    pending = _tools_pending.get(search_session)
+    if pending is None:
+        pending = asyncio.create_task(_fetch_tools(search_session))
+        _tools_pending[search_session] = pending
+
+        def _done(task: asyncio.Task):
+            if _tools_pending.get(search_session) is task:
+                del _tools_pending[search_session]
+
+        pending.add_done_callback(_done)
+    # Отмена одного ожидающего не прерывает вызов для остальных
+    return await asyncio.shield(pending)
+
+
+def invalidate_tools(search_session):
+    _tools_cache.pop(search_session, None)
+    _tools_pending.pop(search_session, None)
+
+
+# --- Пул MCP-сессий к серверам поиска ---
+class PooledSession:
+    def __init__(self, index: int, session: ClientSession):
+        self.index = index
+        self.session = session
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0  # подряд идущие ошибки
+        self.healthy = True
+        self.retry_at = 0.0
+
+
+class SearchSessionPool:
+    """Пул из N сессий к отдельным процессам сервера поиска.
+
+    Вызов уходит в здоровую сессию с наименьшим числом активных вызовов.
+    После max_failures ошибок подряд сессия исключается из выбора на
+    retry_delay секунд, затем снова получает вызовы; первый успешный вызов
+    возвращает её в строй. Интерфейс (list_tools/call_tool) совпадает с
+    ClientSession, поэтому пул можно передавать в call_search_tool.
+
+    Контексты сессий (anyio) должны открываться и закрываться в одной задаче,
+    поэтому ими владеет отдельная фоновая задача, которая живёт до close().
+
+    Кэш списка инструментов (resolve_tools) сбрасывается при (пере)подключении
+    сессий и по уведомлению сервера tools/list_changed — для этого
+    handle_message передаётся сессиям как message_handler.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[int], AsyncContextManager[ClientSession]],
+        size: int = 1,
+        max_failures: int = 3,
+        retry_delay: float = 30.0,
+    ):
+        self.session_factory = session_factory
+        self.size = max(1, size)
+        self.max_failures = max_failures
+        self.retry_delay = retry_delay
+        self.sessions: List[PooledSession] = []
+        self._stop: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    async def start(self, server_name: str) -> bool:
+        invalidate_tools(self)
+        self._stop = asyncio.Event()
+        ready = asyncio.get_running_loop().create_future()
+        self._runner = asyncio.create_task(self._run(server_name, ready))
+        return await ready
+
+    async def _run(self, server_name: str, ready: asyncio.Future):
+        try:
+            async with AsyncExitStack() as stack:
+                for index in range(self.size):
+                    try:
+                        session = await stack.enter_async_context(self.session_factory(index))
+                    except Exception as e:
+                        print(f"Не удалось запустить сервер поиска #{index}: {e}")
+                        continue
+                    if await check_server_ready(session, server_name):
+                        self.sessions.append(PooledSession(index, session))
+                    else:
+                        print(f"Сервер поиска #{index} не готов.")
+                ready.set_result(bool(self.sessions))
+                await self._stop.wait()
+                self.sessions = []
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"Ошибка при закрытии сессий поиска: {e}")
+
+    def _pick(self) -> PooledSession:
+        now = time.monotonic()
+        candidates = [s for s in self.sessions if s.healthy or s.retry_at <= now]
+        # Если все сессии нездоровы — пробуем любую, а не отказываем сразу
+        return min(candidates or self.sessions, key=lambda s: s.in_flight)
+
+    async def _call(self, method: str, *args, **kwargs) -> Any:
+        pooled = self._pick()
+        pooled.in_flight += 1
+        pooled.calls += 1
+        try:
+            result = await getattr(pooled.session, method)(*args, **kwargs)
+        except Exception:
+            pooled.failures += 1
+            if pooled.failures >= self.max_failures:
+                pooled.healthy = False
+                pooled.retry_at = time.monotonic() + self.retry_delay
+            raise
+        else:
+            pooled.failures = 0
+            pooled.healthy = True
+            return result
+        finally:
+            pooled.in_flight -= 1
+
+    async def list_tools(self):
+        return await self._call("list_tools")
+
+    async def handle_message(self, message):
+        if isinstance(message, types.ServerNotification) and isinstance(
+            message.root, types.ToolListChangedNotification
+        ):
+            invalidate_tools(self)
+
+    async def call_tool(self, name: str, arguments: Optional[dict] = None, **kwargs):
+        return await self._call("call_tool", name, arguments=arguments, **kwargs)
+
+    def stats(self) -> List[dict]:
+        return [
+            {
+                "index": s.index,
+                "in_flight": s.in_flight,
+                "calls": s.calls,
+                "failures": s.failures,
+                "healthy": s.healthy,
+            }
+            for s in self.sessions
+        ]
+
+    async def close(self):
+        if self._runner is None:
+            return
+        self._stop.set()
+        await self._runner
+        self._runner = None
+        invalidate_tools(self)
+
+
+# --- Поиск в том же процессе, без MCP-подпроцесса ---
+class LocalToolContext:
+    """Замена MCP Context для прямого вызова инструментов: логи идут в logging"""
+
+    def __init__(self, logger: logging.Logger, progress_callback: Optional[Callable] = None):
+        self.logger = logger
+        self.progress_callback = progress_callback
+
+    async def debug(self, message: str, **extra):
+        self.logger.debug(message)
+
+    async def info(self, message: str, **extra):
+        self.logger.info(message)
+
+    async def warning(self, message: str, **extra):
+        self.logger.warning(message)
+
+    async def error(self, message: str, **extra):
+        self.logger.error(message)
+
+    async def report_progress(self, progress: float, total: Optional[float] = None, message: Optional[str] = None):
+        if self.progress_callback is not None:
+            await self.progress_callback(progress, total, message)
+
+
+class InProcessSearchSession:
+    """Вызывает инструменты сервера поиска напрямую в процессе бота.
+
+    Интерфейс (list_tools/call_tool) и результаты совпадают с ClientSession,
+    форматирование и обработка ошибок — те же функции сервера, но без
+    JSON-RPC, pipe и отдельного процесса.
+    """
+
+    def __init__(self):
+        import search_server_duckduck_go as server
+
+        self.server = server
+        self.logger = logging.getLogger("search_server")
+        # Имена инструментов: набор не меняется, list_tools строит модели заново
+        self._tool_names: Optional[set] = None
+
+    async def list_tools(self) -> ListToolsResult:
+        tools = await self.server.mcp.list_tools()
+        self._tool_names = {tool.name for tool in tools}
+        return ListToolsResult(tools=tools)
+
+    async def call_tool(self, name: str, arguments: Optional[dict] = None, **kwargs) -> CallToolResult:
+        if self._tool_names is None:
+            await self.list_tools()
+        if name not in self._tool_names:
+            return CallToolResult(content=[TextContent(type="text", text=f"Unknown tool: {name}")], isError=True)
+        tool_fn = getattr(self.server, name)
+        arguments = dict(arguments or {})
+        if "ctx" in inspect.signature(tool_fn).parameters:
+            arguments["ctx"] = LocalToolContext(self.logger, kwargs.get("progress_callback"))
+        try:
+            text = await tool_fn(**arguments)
+        except Exception as e:
+            # Так же, как FastMCP оформляет исключение инструмента
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Error executing tool {name}: {e}")], isError=True
+            )
+        return CallToolResult(content=[TextContent(type="text", text=text)])
+
+    async def close(self):
+        await self.server.searcher.aclose()
+
+
+async def call_search_tool(
+    search_session: ClientSession,
+    query: str,
+    progress_callback: Optional[Callable] = None,
+    **arguments,
+) -> str:
     try:
-        list_tools_result = await search_session.list_tools()
-        search_tool: Tool = next((t for t in list_tools_result.tools if t.name == "search"), None)
+        tools = await resolve_tools(search_session)
+        search_tool: Optional[Tool] = tools.get("search")
         if not search_tool:
             return "Инструмент 'search' не найден на сервере."
-        call_result = await search_session.call_tool("search", arguments={"query": query})
+        # Идентификатор трассировки уходит на сервер в _meta запроса
+        # (параметр meta есть в call_tool начиная с mcp 1.20)
+        trace_id = current_trace.get()
+        extra = {"meta": {"trace_id": trace_id}} if trace_id else {}
+        with _stage("mcp_call"):
+            call_result = await search_session.call_tool(
+                "search",
+                arguments={"query": query, **arguments},
+                progress_callback=progress_callback,
+                **extra,
+            )
         if call_result.content and isinstance(call_result.content[0], TextContent):
             return call_result.content[0].text
         else:
@@ -40,42 +329,412 @@ async def call_search_tool(search_session: ClientSession, query: str) -> str:
         return f"Ошибка при вызове инструмента 'search': {e}"
 
 
-async def save_result_to_file(content: str, base_dir: str, query: str = "search_result"):
-    try:
-        report_dir = os.path.join(base_dir, "report")
-        os.makedirs(report_dir, exist_ok=True)
-        now = datetime.now()
-        safe_query = "".join(c for c in query if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_query = safe_query[:30]
-        filename = f"report-{now.strftime('%H-%M-%S')}-{safe_query}.txt"
-        filepath = os.path.join(report_dir, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return filepath
-    except Exception as e:
-        return None
+def search_server_connection(script_dir: str, index: int = 0, pool_size: int = 1) -> dict:
+    """Параметры подключения к серверу поиска.
+
+    Если задан SEARCH_SERVER_URL, бот подключается к уже запущенному общему
+    серверу (streamable HTTP или SSE, при SEARCH_SERVER_UDS — через Unix-сокет),
+    иначе запускает сервер подпроцессом по stdio. index — номер процесса в
+    пуле: его метрики слушают порт DDG_METRICS_PORT + index.
+
+    У каждого процесса пула свой ограничитель частоты, поэтому лимит
+    DDG_REQUESTS_PER_MINUTE и DDG_RATE_BURST делятся между pool_size
+    процессами. Каждому процессу достаётся не меньше 1, так что вместе они
+    могут отправить до max(лимит, pool_size) запросов в минуту и до
+    max(DDG_RATE_BURST, pool_size) подряд.
+    """
+    url = os.getenv("SEARCH_SERVER_URL")
+    if url:
+        connection = {
+            "transport": os.getenv("SEARCH_SERVER_TRANSPORT", "streamable_http"),
+            "url": url,
+        }
+        uds = os.getenv("SEARCH_SERVER_UDS")
+        if uds:
+            def uds_client_factory(headers=None, timeout=None, auth=None):
+                return httpx.AsyncClient(
+                    transport=httpx.AsyncHTTPTransport(uds=uds),
+                    headers=headers,
+                    timeout=timeout if timeout is not None else httpx.Timeout(30.0, read=300.0),
+                    auth=auth,
+                )
+
+            connection["httpx_client_factory"] = uds_client_factory
+        return connection
+
+    # Настройки сервера (DDG_*) из окружения и .env передаём в подпроцесс
+    env = {"PYTHONPATH": script_dir, **{k: v for k, v in os.environ.items() if k.startswith("DDG_")}}
+    if env.get("DDG_METRICS_PORT"):
+        env["DDG_METRICS_PORT"] = str(int(env["DDG_METRICS_PORT"]) + index)
+    if pool_size > 1:
+        requests_per_minute = int(env.get("DDG_REQUESTS_PER_MINUTE") or 30)
+        if requests_per_minute > 0:
+            env["DDG_REQUESTS_PER_MINUTE"] = str(max(1, requests_per_minute // pool_size))
+            env["DDG_RATE_BURST"] = str(max(1, int(env.get("DDG_RATE_BURST") or 3) // pool_size))
+    return {
+        "command": "python",
+        "args": [os.path.join(script_dir, "search_server_duckduck_go.py")],
+        "transport": "stdio",
+        "env": env,
+    }
 
 
 # --- Telegram bot logic ---
+# --- Параллельная обработка обновлений с ограниченной очередью ---
+OVERLOAD_REPLY = "Бот сейчас перегружен запросами, попробуйте ещё раз через минуту."
+
+
+class BoundedUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает до max_concurrent_updates обновлений одновременно.
+
+    Ещё до max_pending обновлений ждут свободного места; следующие сверх
+    этого сразу получают ответ OVERLOAD_REPLY и не обрабатываются, так что
+    очередь и время ожидания ответа ограничены.
+
+    Семафор базового класса только пропускает обновления в do_process_update
+    (process_update в BaseUpdateProcessor финальный), поэтому его ёмкость
+    больше лимитов, а параллельность и очередь считаются здесь.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending: int = 100):
+        self.limit = max(1, max_concurrent_updates)
+        self.max_pending = max(0, max_pending)
+        # Запас сверх лимитов — для обновлений, которым сейчас отправляется отказ
+        super().__init__(2 * (self.limit + self.max_pending) + 1)
+        self.running = 0
+        self.pending = 0
+        self.processed = 0
+        self.rejected = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def current_concurrent_updates(self) -> int:
+        return self.running
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self.limit)
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        if self.running + self.pending >= self.limit + self.max_pending:
+            self.rejected += 1
+            if inspect.iscoroutine(coroutine):
+                coroutine.close()
+            await self._reject(update)
+            return
+        self.pending += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.pending -= 1
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+            self.processed += 1
+            self._slots.release()
+
+    async def _reject(self, update: object):
+        message = update.effective_message if isinstance(update, Update) else None
+        if message is None:
+            return
+        try:
+            await message.reply_text(OVERLOAD_REPLY)
+        except Exception as e:
+            print(f"Не удалось отправить ответ о перегрузке: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": self.pending,
+            "processed": self.processed,
+            "rejected": self.rejected,
+        }
+
+
+# --- Inline-режим: @бот запрос ---
+class InlineSearch:
+    """Поиск для inline-запросов, которые Telegram присылает на каждое нажатие клавиши.
+
+    Для каждого пользователя ищется только последний запрос: он ждёт
+    debounce секунд, и если за это время пришёл новый, старый отменяется
+    (в том числе уже начатый поиск). Ответы кэшируются на ttl секунд, так
+    что стирание и повторный набор не тратят лимит запросов к DuckDuckGo.
+    """
+
+    def __init__(
+        self,
+        search_session,
+        debounce: float = 0.6,
+        ttl: float = 60.0,
+        max_results: int = 10,
+        min_length: int = 3,
+        max_entries: int = 256,
+    ):
+        self.search_session = search_session
+        self.debounce = debounce
+        self.ttl = ttl
+        self.max_results = max_results
+        self.min_length = min_length
+        self.max_entries = max_entries
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cache: "OrderedDict[str, Tuple[float, List[InlineQueryResultArticle]]]" = OrderedDict()
+        self.searches = 0
+        self.cache_hits = 0
+        self.superseded = 0
+
+    @staticmethod
+    def make_key(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    def _cached(self, key: str) -> Optional[List[InlineQueryResultArticle]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, articles = entry
+        if expires_at <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return articles
+
+    def _store(self, key: str, articles: List[InlineQueryResultArticle]):
+        self._cache[key] = (time.monotonic() + self.ttl, articles)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        inline_query = update.inline_query
+        key = self.make_key(inline_query.query)
+        user_id = inline_query.from_user.id
+        # Более новый запрос отменяет предыдущий, даже если он сам слишком короткий
+        previous = self._tasks.pop(user_id, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+        if len(key) < self.min_length:
+            return
+
+        articles = self._cached(key)
+        if articles is not None:
+            self.cache_hits += 1
+            await self._answer(inline_query, articles)
+            return
+        # Ожидание и поиск — в отдельной задаче, чтобы не занимать слот обработки обновлений
+        task = asyncio.create_task(self._search_later(inline_query, key))
+        self._tasks[user_id] = task
+
+        def _done(t: asyncio.Task):
+            if self._tasks.get(user_id) is t:
+                del self._tasks[user_id]
+
+        task.add_done_callback(_done)
+
+    async def _search_later(self, inline_query, key: str):
+        await asyncio.sleep(self.debounce)
+        articles = self._cached(key)
+        if articles is None:
+            self.searches += 1
+            search_result = await call_search_tool(
+                self.search_session, inline_query.query, max_results=self.max_results, output_format="json"
+            )
+            articles = self.make_articles(search_result)
+            if articles is None:
+                print(f"Ошибка inline-поиска: {search_result}")
+                return
+            # Пустой ответ бывает и при сбое DuckDuckGo — его не кэшируем, как и сервер
+            if articles:
+                self._store(key, articles)
+        await self._answer(inline_query, articles)
+
+    @staticmethod
+    def make_articles(search_result: str) -> Optional[List[InlineQueryResultArticle]]:
+        try:
+            results = json.loads(search_result)["results"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        return [
+            InlineQueryResultArticle(
+                id=str(result["position"]),
+                title=result["title"],
+                description=result["snippet"],
+                url=result["link"],
+                input_message_content=InputTextMessageContent(f"{result['title']}\n{result['link']}"),
+            )
+            for result in results
+        ]
+
+    async def _answer(self, inline_query, articles: List[InlineQueryResultArticle]):
+        try:
+            await inline_query.answer(articles, cache_time=int(self.ttl) if articles else 0)
+        except Exception as e:
+            # Например, запрос устарел, пока шёл поиск
+            print(f"Не удалось ответить на inline-запрос: {e}")
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        return {
+            "searches": self.searches,
+            "cache_hits": self.cache_hits,
+            "superseded": self.superseded,
+            "cached_queries": len(self._cache),
+        }
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Привет! Введите поисковый запрос.")
 
 
+# --- Ответ, который дополняется по мере поступления результатов ---
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class ProgressMessage:
+    """Сообщение-заглушка, которое редактируется по мере прихода результатов.
+
+    update() подходит как progress_callback для call_tool: текст из
+    уведомлений о прогрессе дописывается к сообщению. Правки не чаще одной
+    в min_interval секунд (Telegram ограничивает частоту правок в чате),
+    промежуточные обновления склеиваются в одну отложенную правку.
+
+    MCP-сессия вызывает progress_callback прямо в цикле приёма сообщений,
+    поэтому update() только запоминает текст и планирует правку в
+    отдельной задаче: запрос к Telegram не задерживает ответы остальным чатам.
+    """
+
+    def __init__(self, message, header: str, min_interval: float = 1.5):
+        self.message = message
+        self.header = header
+        self.min_interval = min_interval
+        self.parts: List[str] = []
+        self.found = 0
+        self.edits = 0
+        self._last_edit = time.monotonic()  # сама заглушка только что отправлена
+        self._shown = ""
+        self._lock = asyncio.Lock()
+        self._pending: Optional[asyncio.Task] = None
+
+    def text(self) -> str:
+        return f"{self.header} (найдено: {self.found})\n\n" + "\n".join(self.parts)
+
+    async def update(self, progress: float, total: Optional[float] = None, message: Optional[str] = None):
+        if message:
+            self.parts.append(message)
+        self.found = int(progress)
+        if self._pending is None:
+            delay = max(0.0, self._last_edit + self.min_interval - time.monotonic())
+            self._pending = asyncio.create_task(self._edit_later(delay))
+
+    async def _edit_later(self, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._pending = None
+        await self._edit(self.text())
+
+    async def _edit(self, text: str):
+        text = text[:TELEGRAM_MESSAGE_LIMIT]
+        async with self._lock:
+            if text == self._shown:
+                return
+            try:
+                await self.message.edit_text(text)
+                self._shown = text
+                self.edits += 1
+            except Exception as e:
+                print(f"Не удалось обновить сообщение: {e}")
+            self._last_edit = time.monotonic()
+
+    async def finish(self, text: str):
+        """Окончательный текст; отложенная промежуточная правка отменяется"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if len(text) <= TELEGRAM_MESSAGE_LIMIT:
+            await self._edit(text)
+        else:
+            # Не помещается в одно сообщение — как и раньше, ответ отдельным сообщением
+            await self.message.reply_text(text)
+
+
 async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.message.text.strip()
     if not query:
         await update.message.reply_text("Пожалуйста, введите непустой запрос.")
         return
-    # Используем глобальный search_session
-    search_result = await call_search_tool(context.application.search_session, query)
+    # Свой идентификатор трассировки на каждый запрос: по нему ответ в чате
+    # связывается с записями журнала и интервалами бота и сервера поиска
+    with trace(new_trace_id()), span("handle_query", chat_id=update.effective_chat.id, message_id=update.message.message_id):
+        await answer_query(update, context, query)
+
+
+async def answer_query(update: Update, context: ContextTypes.DEFAULT_TYPE, query: str):
+    # Сразу показываем, что запрос принят, и дополняем ответ по мере поиска
+    placeholder = await update.message.reply_text(f"Ищу: {query}…")
+    progress = ProgressMessage(
+        placeholder, "Результаты поиска", float(os.getenv("PROGRESS_EDIT_INTERVAL", "1.5"))
+    )
+    # Используем глобальный search_session. Промежуточные результаты сервер
+    # присылает, только если max_results требует нескольких страниц выдачи
+    search_result = await call_search_tool(
+        context.application.search_session,
+        query,
+        progress.update,
+        max_results=int(os.getenv("SEARCH_MAX_RESULTS", "10")),
+    )
     if search_result and not search_result.startswith("Ошибка"):
-        saved_file_path = await save_result_to_file(search_result, context.application.base_dir, query)
-        if saved_file_path:
-            await update.message.reply_text(f"Результат поиска:\n{search_result}\n\nСохранено в: {saved_file_path}")
-        else:
-            await update.message.reply_text("Ошибка при сохранении результата.")
+        # Отчёт пишется в фоне, ответ уходит сразу
+        SEARCHES.inc(result="ok")
+        try:
+            with _stage("report_submit"):
+                saved_file_path = await context.application.report_writer.submit(
+                    search_result, query, update.effective_chat.id
+                )
+        except Exception:
+            saved_file_path = None
+        with _stage("telegram_reply"):
+            if saved_file_path:
+                await progress.finish(f"Результат поиска:\n{search_result}\n\nСохранено в: {saved_file_path}")
+            else:
+                await progress.finish("Ошибка при сохранении результата.")
     else:
-        await update.message.reply_text(f"Ошибка поиска: {search_result}")
+        SEARCHES.inc(result="error")
+        with _stage("telegram_reply"):
+            await progress.finish(f"Ошибка поиска: {search_result}")
+
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    terms = " ".join(context.args or [])
+    if not terms.strip():
+        await update.message.reply_text("Использование: /history <слова для поиска по сохранённым отчётам>")
+        return
+    # Поиск только по локальному индексу отчётов, без обращения к DuckDuckGo
+    try:
+        matches = await asyncio.to_thread(
+            context.application.report_index.search,
+            terms,
+            update.effective_chat.id,
+            int(os.getenv("HISTORY_RESULTS", "5")),
+            os.getenv("HISTORY_INCLUDE_UNASSIGNED", "false").strip().lower() in ("1", "true", "yes", "on"),
+        )
+    except Exception as e:
+        await update.message.reply_text(f"Ошибка поиска по истории: {e}")
+        return
+    if not matches:
+        await update.message.reply_text("В сохранённых отчётах ничего не найдено.")
+        return
+    lines = [f"Найдено в сохранённых отчётах ({len(matches)}):"]
+    for match in matches:
+        lines.append(f"\n{match.created_at:%Y-%m-%d %H:%M} — {match.query}\n{match.snippet}")
+    await update.message.reply_text("\n".join(lines)[:4096])
 
 
 def main():
@@ -84,42 +743,151 @@ def main():
     if not BOT_TOKEN:
         print("Ошибка: BOT_TOKEN не найден в .env")
         return
+    configure_logging(os.getenv("LOG_LEVEL"))
+    trace_file = os.getenv("TRACE_FILE")
+    if trace_file:
+        configure_export(trace_file, f"bot {os.getpid()}")
+        # Сервер поиска пишет свои интервалы в тот же файл, если не указан другой
+        os.environ.setdefault("DDG_TRACE_FILE", trace_file)
     script_dir = os.path.dirname(os.path.realpath(__file__))
-    search_server_path = os.path.join(script_dir, "search_server_duckduck_go.py")
-    if not os.path.exists(search_server_path):
-        print(f"Серверный скрипт поиска не найден: {search_server_path}")
-        return
-    client = MultiServerMCPClient({
-        "search": {
-            "command": "python",
-            "args": [search_server_path],
-            "transport": "stdio",
-            "env": {"PYTHONPATH": script_dir}
-        }
-    })
-    # MCP-сессия — асинхронная, инициализируем до запуска бота
     loop = asyncio.get_event_loop()
-    search_session_cm = client.session("search")
-    search_session = loop.run_until_complete(search_session_cm.__aenter__())
-    search_ready = loop.run_until_complete(check_server_ready(search_session, "search"))
-    if not search_ready:
-        print("Сервер поиска не готов. Завершение.")
-        return
+    if os.getenv("SEARCH_BACKEND", "mcp") == "inprocess":
+        # Поиск в процессе бота: без подпроцесса и JSON-RPC
+        search_session = InProcessSearchSession()
+    else:
+        pool_size = int(os.getenv("SEARCH_POOL_SIZE", "1"))
+        # Своё подключение на каждый процесс пула (у каждого свой порт метрик)
+        connections = {
+            f"search-{index}": search_server_connection(script_dir, index, pool_size) for index in range(pool_size)
+        }
+        connection = connections["search-0"]
+        if connection["transport"] == "stdio" and not os.path.exists(connection["args"][0]):
+            print(f"Серверный скрипт поиска не найден: {connection['args'][0]}")
+            return
+        # MCP-сессии — асинхронные, инициализируем пул до запуска бота
+        search_session = SearchSessionPool(lambda index: client.session(f"search-{index}"), size=pool_size)
+        for connection in connections.values():
+            connection["session_kwargs"] = {"message_handler": search_session.handle_message}
+        client = MultiServerMCPClient(connections)
+        search_ready = loop.run_until_complete(search_session.start("search"))
+        if not search_ready:
+            print("Сервер поиска не готов. Завершение.")
+            return
+        if len(search_session.sessions) < pool_size:
+            print(f"Запущено серверов поиска: {len(search_session.sessions)} из {pool_size}")
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = Application.builder().token(BOT_TOKEN)
+    # Медленный поиск в одном чате не задерживает остальные
+    builder.concurrent_updates(
+        BoundedUpdateProcessor(
+            int(os.getenv("BOT_CONCURRENCY", "8")),
+            max_pending=int(os.getenv("BOT_MAX_PENDING", "100")),
+        )
+    )
+    api_base_url = os.getenv("TELEGRAM_API_BASE_URL")
+    if api_base_url:
+        # Другой сервер Bot API (свой telegram-bot-api или локальная заглушка для замеров)
+        builder.base_url(api_base_url)
+    application = builder.build()
     application.base_dir = script_dir
     application.search_session = search_session
+    application.report_writer = ReportWriter(
+        open_report_store(script_dir, os.getenv("REPORT_STORE", "files")),
+        max_queue=int(os.getenv("REPORT_QUEUE_SIZE", "1000")),
+        batch_size=int(os.getenv("REPORT_BATCH_SIZE", "64")),
+        index=ReportIndex(os.path.join(script_dir, "report", "history.db")),
+    )
+    application.report_index = application.report_writer.index
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("history", history))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_query))
+    inline_search = InlineSearch(
+        search_session,
+        debounce=float(os.getenv("INLINE_DEBOUNCE", "0.6")),
+        ttl=float(os.getenv("INLINE_CACHE_TTL", "60")),
+        max_results=int(os.getenv("INLINE_MAX_RESULTS", "10")),
+    )
+    application.add_handler(InlineQueryHandler(inline_search.handle))
+
+    register_bot_metrics(application, inline_search)
+    metrics_port = int(os.getenv("BOT_METRICS_PORT", "0"))
+
+    async def on_startup(app):
+        app.report_writer.start()
+        app.metrics_server = None
+        if metrics_port > 0:
+            try:
+                app.metrics_server = await serve_metrics(metrics_port, os.getenv("BOT_METRICS_HOST", "127.0.0.1"))
+            except OSError as e:
+                print(f"Не удалось открыть порт метрик {metrics_port}: {e}")
 
-    # Хук для корректного завершения MCP-сессии
+    # Хук для корректного завершения: дописываем отчёты и закрываем MCP-сессии
     async def on_shutdown(app):
-        await search_session_cm.__aexit__(None, None, None)
+        if app.metrics_server is not None:
+            app.metrics_server.close()
+        await inline_search.close()
+        await app.report_writer.close()
+        await search_session.close()
+        close_export()
 
+    application.post_init = on_startup
     application.post_shutdown = on_shutdown
 
-    print("Бот запущен.")
-    application.run_polling()
+    run_application(application)
+
+
+def register_bot_metrics(application: Application, inline_search: "InlineSearch"):
+    """Счётчики очереди обработки, записи отчётов, inline-поиска и пула считываются при запросе метрик"""
+    processor = application.update_processor
+    if isinstance(processor, BoundedUpdateProcessor):
+        REGISTRY.gauge("bot_updates", "Обработка обновлений: running, pending, processed, rejected", processor.stats, label="state")
+    writer = application.report_writer
+    REGISTRY.gauge(
+        "bot_reports",
+        "Отчёты: pending (в очереди), written, failed",
+        lambda: {"pending": writer.pending, "written": writer.written, "failed": writer.failed},
+        label="state",
+    )
+    REGISTRY.gauge("bot_inline", "Inline-поиск: searches, cache_hits, superseded, cached_queries", inline_search.stats, label="stat")
+    session = application.search_session
+    if isinstance(session, SearchSessionPool):
+        REGISTRY.gauge(
+            "bot_search_pool_in_flight",
+            "Активные вызовы по процессам сервера поиска",
+            lambda: {str(s["index"]): s["in_flight"] for s in session.stats()},
+            label="session",
+        )
+
+
+def run_application(application: Application):
+    """Получение обновлений: long polling (по умолчанию) или вебхук"""
+    mode = os.getenv("BOT_MODE", "polling")
+    if mode != "webhook":
+        if mode != "polling":
+            print(f"Неизвестный BOT_MODE '{mode}', используется polling")
+        print("Бот запущен (polling).")
+        application.run_polling()
+        return
+
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if not webhook_url:
+        print("Ошибка: для BOT_MODE=webhook нужен WEBHOOK_URL")
+        return
+    url_path = os.getenv("WEBHOOK_PATH", urlparse(webhook_url).path).strip("/")
+    # Telegram присылает секрет в заголовке X-Telegram-Bot-Api-Secret-Token,
+    # запросы без него отклоняются. Вебхук регистрируется заново при каждом
+    # запуске, поэтому случайный секрет подходит, если свой не задан.
+    secret_token = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+    listen = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+    port = int(os.getenv("WEBHOOK_PORT", "8443"))
+    print(f"Бот запущен (webhook, слушает {listen}:{port}/{url_path}).")
+    application.run_webhook(
+        listen=listen,
+        port=port,
+        url_path=url_path,
+        webhook_url=webhook_url,
+        secret_token=secret_token,
+    )
 
 
 if __name__ == "__main__":
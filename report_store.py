@@ -0,0 +1,468 @@
+import os
+import re
+import sys
+import asyncio
+import argparse
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from telemetry import REGISTRY
+
+REPORT_WRITE_SECONDS = REGISTRY.histogram("bot_report_write_seconds", "Запись одной пачки отчётов на диск")
+
+
+class Report(NamedTuple):
+    created_at: datetime
+    chat_id: Optional[int]
+    query: str
+    content: str
+
+
+def _timestamp(value: datetime) -> str:
+    # Строки одной ширины сравниваются в SQLite так же, как сами даты
+    return value.isoformat(timespec="microseconds")
+
+
+def safe_query_name(query: str) -> str:
+    safe_query = "".join(c for c in query if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    return safe_query[:30]
+
+
+class FileReportStore:
+    """Один файл на отчёт: report/report-<hh>-<mm>-<ss>-<запрос>.txt"""
+
+    def __init__(self, report_dir: str, fsync: bool = True):
+        self.report_dir = report_dir
+        self.fsync = fsync
+
+    def locate(self, report: Report) -> str:
+        filename = f"report-{report.created_at.strftime('%H-%M-%S')}-{safe_query_name(report.query)}.txt"
+        return os.path.join(self.report_dir, filename)
+
+    def write_batch(self, reports: List[Report]) -> int:
+        os.makedirs(self.report_dir, exist_ok=True)
+        # Отчёты с одинаковым именем (та же секунда и запрос) нельзя открывать
+        # одновременно — их записи перемешаются; как и при записи по одному,
+        # в файле остаётся последний из них
+        targets: Dict[str, Report] = {}
+        for report in reports:
+            filepath = self.locate(report)
+            targets.pop(filepath, None)
+            targets[filepath] = report
+        files = []
+        opened = set()
+        try:
+            for filepath, report in targets.items():
+                try:
+                    f = open(filepath, 'w', encoding='utf-8')
+                except OSError as e:
+                    print(f"Ошибка при сохранении отчёта {filepath}: {e}")
+                    continue
+                files.append(f)
+                opened.add(filepath)
+                f.write(report.content)
+            for f in files:
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+        finally:
+            for f in files:
+                f.close()
+        if self.fsync and files and hasattr(os, "O_DIRECTORY"):
+            # Один fsync каталога на всю пачку, чтобы новые имена файлов тоже пережили сбой
+            dir_fd = os.open(self.report_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        return sum(1 for report in reports if self.locate(report) in opened)
+
+    def close(self):
+        pass
+
+
+class SqliteReportStore:
+    """Все отчёты в одной базе SQLite (report/reports.db).
+
+    Добавление — одна вставка в конец таблицы (пачка — одна транзакция и один
+    fsync журнала), индексы по времени, чату и запросу дают быстрые выборки
+    по диапазонам без перебора тысяч файлов.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reports (
+                    id INTEGER PRIMARY KEY,
+                    created_at TEXT NOT NULL,
+                    chat_id INTEGER,
+                    query TEXT NOT NULL,
+                    content TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS reports_created_at ON reports (created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS reports_chat ON reports (chat_id, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS reports_query ON reports (query, created_at)")
+
+    def locate(self, report: Report) -> str:
+        chat = f", чат {report.chat_id}" if report.chat_id is not None else ""
+        return f"{self.path} ({report.created_at.isoformat(sep=' ', timespec='seconds')}{chat})"
+
+    def write_batch(self, reports: List[Report]) -> int:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO reports (created_at, chat_id, query, content) VALUES (?, ?, ?, ?)",
+                [(_timestamp(r.created_at), r.chat_id, r.query, r.content) for r in reports],
+            )
+        return len(reports)
+
+    def contains(self, created_at: datetime, query: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM reports WHERE query = ? AND created_at = ? LIMIT 1",
+                (query, _timestamp(created_at)),
+            ).fetchone()
+        return row is not None
+
+    def scan(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        chat_id: Optional[int] = None,
+        query: Optional[str] = None,
+        limit: int = 100,
+    ) -> Iterator[Report]:
+        """Отчёты за [start, end) по возрастанию времени, с фильтром по чату и запросу"""
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("created_at >= ?")
+            params.append(_timestamp(start))
+        if end is not None:
+            conditions.append("created_at < ?")
+            params.append(_timestamp(end))
+        if chat_id is not None:
+            conditions.append("chat_id = ?")
+            params.append(chat_id)
+        if query is not None:
+            conditions.append("query = ?")
+            params.append(query)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT created_at, chat_id, query, content FROM reports {where} ORDER BY created_at LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        for created_at, chat_id_, query_, content in rows:
+            yield Report(datetime.fromisoformat(created_at), chat_id_, query_, content)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_report_store(base_dir: str, kind: str = "files"):
+    report_dir = os.path.join(base_dir, "report")
+    if kind == "sqlite":
+        return SqliteReportStore(os.path.join(report_dir, "reports.db"))
+    if kind != "files":
+        print(f"Неизвестный тип хранилища отчётов '{kind}', используются файлы")
+    return FileReportStore(report_dir)
+
+
+class HistoryMatch(NamedTuple):
+    created_at: datetime
+    query: str
+    snippet: str
+
+
+class ReportIndex:
+    """Полнотекстовый индекс отчётов (SQLite FTS5, report/history.db).
+
+    Не зависит от выбранного хранилища: ReportWriter добавляет в него каждую
+    записанную пачку, а /history ищет по нему без обращения к сети.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS report_fts USING fts5(
+                    query, content, created_at UNINDEXED, chat_id UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+                """
+            )
+            # Обычная таблица ключей для contains(): поиск по UNINDEXED-столбцам
+            # FTS5 — полный перебор, а повторная индексация проверяет каждый файл
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS report_keys (
+                    created_at TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    PRIMARY KEY (created_at, query)
+                ) WITHOUT ROWID
+                """
+            )
+            if self._conn.execute("SELECT 1 FROM report_keys LIMIT 1").fetchone() is None:
+                # Индекс, созданный до появления таблицы ключей
+                self._conn.execute("INSERT OR IGNORE INTO report_keys SELECT created_at, query FROM report_fts")
+
+    def add_batch(self, reports: List[Report]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO report_fts (query, content, created_at, chat_id) VALUES (?, ?, ?, ?)",
+                [(r.query, r.content, _timestamp(r.created_at), r.chat_id) for r in reports],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO report_keys (created_at, query) VALUES (?, ?)",
+                [(_timestamp(r.created_at), r.query) for r in reports],
+            )
+
+    def contains(self, created_at: datetime, query: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM report_keys WHERE created_at = ? AND query = ?",
+                (_timestamp(created_at), query),
+            ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def match_expression(terms: str) -> str:
+        # Каждое слово — префикс в кавычках: пользовательский ввод не разбирается
+        # как синтаксис FTS5, «бот» находит и «ботов», слова объединяются через AND
+        words = re.findall(r"\w+", terms)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search(
+        self, terms: str, chat_id: Optional[int] = None, limit: int = 5, include_unassigned: bool = False
+    ) -> List[HistoryMatch]:
+        """Самые релевантные отчёты (bm25), где встречаются все слова из terms.
+
+        С chat_id — только отчёты этого чата; отчёты без чата (сохранённые до
+        индекса или добавленные командой index) — лишь при include_unassigned.
+        """
+        expression = self.match_expression(terms)
+        if not expression:
+            return []
+        sql = (
+            "SELECT created_at, query, snippet(report_fts, 1, '«', '»', '…', 16) "
+            "FROM report_fts WHERE report_fts MATCH ?"
+        )
+        params: List = [expression]
+        if chat_id is not None:
+            sql += " AND (chat_id = ? OR chat_id IS NULL)" if include_unassigned else " AND chat_id = ?"
+            params.append(chat_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [HistoryMatch(datetime.fromisoformat(created_at), query, snippet) for created_at, query, snippet in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ReportWriter:
+    """Фоновая (write-behind) запись отчётов о поиске.
+
+    submit() сразу возвращает, где будет лежать отчёт, и кладёт его в
+    ограниченную очередь; если диск не успевает и очередь заполнена, submit()
+    ждёт (backpressure). Фоновая задача забирает отчёты пачками до batch_size
+    и передаёт их хранилищу в отдельном потоке, не блокируя цикл событий;
+    хранилище синхронизирует с диском всю пачку разом. Если задан index,
+    записанная пачка сразу добавляется в полнотекстовый индекс. close()
+    дописывает всё, что осталось в очереди.
+    """
+
+    def __init__(self, store, max_queue: int = 1000, batch_size: int = 64, index: Optional[ReportIndex] = None):
+        self.store = store
+        self.index = index
+        self.batch_size = batch_size
+        self.written = 0
+        self.failed = 0
+        self._queue: "asyncio.Queue[Optional[Report]]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, content: str, query: str = "search_result", chat_id: Optional[int] = None) -> str:
+        if self._task is None:
+            raise RuntimeError("ReportWriter is not running")
+        report = Report(datetime.now(), chat_id, query, content)
+        await self._queue.put(report)
+        return self.store.locate(report)
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            batch: List[Report] = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                try:
+                    with REPORT_WRITE_SECONDS.time():
+                        written = await asyncio.to_thread(self.store.write_batch, batch)
+                    self.written += written
+                    self.failed += len(batch) - written
+                except Exception as e:
+                    self.failed += len(batch)
+                    print(f"Ошибка при сохранении отчётов: {e}")
+                if self.index is not None:
+                    try:
+                        await asyncio.to_thread(self.index.add_batch, batch)
+                    except Exception as e:
+                        print(f"Ошибка при индексации отчётов: {e}")
+            if stop:
+                return
+
+    async def close(self):
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        self.store.close()
+        if self.index is not None:
+            self.index.close()
+
+
+# --- Перенос старых отчётов report-<hh>-<mm>-<ss>-<запрос>.txt в SQLite ---
+REPORT_FILE_RE = re.compile(r"^report-(\d{2})-(\d{2})-(\d{2})-(.*)\.txt$")
+
+
+def iter_report_files(report_dir: str) -> Iterator[Tuple[str, datetime, str]]:
+    """(путь, время, запрос) для файлов отчётов, от старых к новым"""
+    for entry in sorted(os.scandir(report_dir), key=lambda e: e.stat().st_mtime):
+        match = REPORT_FILE_RE.match(entry.name)
+        if not match or not entry.is_file():
+            continue
+        hours, minutes, seconds, query = match.groups()
+        modified = datetime.fromtimestamp(entry.stat().st_mtime)
+        yield entry.path, modified.replace(hour=int(hours), minute=int(minutes), second=int(seconds), microsecond=0), query
+
+
+def migrate_files(report_dir: str, store: SqliteReportStore, delete: bool = False, batch_size: int = 500) -> int:
+    """Переносит файлы отчётов в базу; дата берётся из времени изменения файла.
+
+    Уже перенесённые отчёты (то же время и запрос) пропускаются, так что
+    миграцию можно запускать повторно.
+    """
+    migrated = 0
+    batch: List[Report] = []
+    batch_files: List[str] = []
+
+    def flush():
+        nonlocal migrated
+        if batch:
+            migrated += store.write_batch(batch)
+            if delete:
+                for filepath in batch_files:
+                    os.remove(filepath)
+            batch.clear()
+            batch_files.clear()
+
+    for filepath, created_at, query in iter_report_files(report_dir):
+        if store.contains(created_at, query):
+            continue
+        with open(filepath, encoding='utf-8') as f:
+            batch.append(Report(created_at, None, query, f.read()))
+        batch_files.append(filepath)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return migrated
+
+
+def rebuild_index(report_dir: str, index: ReportIndex, db_path: Optional[str] = None, batch_size: int = 500) -> int:
+    """Добавляет в индекс отчёты из файлов и из базы, которых в нём ещё нет"""
+    indexed = 0
+    batch: List[Report] = []
+
+    def flush():
+        nonlocal indexed
+        if batch:
+            index.add_batch(batch)
+            indexed += len(batch)
+            batch.clear()
+
+    for filepath, created_at, query in iter_report_files(report_dir):
+        if index.contains(created_at, query):
+            continue
+        with open(filepath, encoding='utf-8') as f:
+            batch.append(Report(created_at, None, query, f.read()))
+        if len(batch) >= batch_size:
+            flush()
+    if db_path and os.path.exists(db_path):
+        store = SqliteReportStore(db_path)
+        try:
+            for report in store.scan(limit=-1):
+                if not index.contains(report.created_at, report.query):
+                    batch.append(report)
+                if len(batch) >= batch_size:
+                    flush()
+        finally:
+            store.close()
+    flush()
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Хранилище отчётов о поиске")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="перенести файлы report-*.txt в SQLite")
+    migrate.add_argument("--report-dir", default=os.path.join(os.path.dirname(os.path.realpath(__file__)), "report"))
+    migrate.add_argument("--db", help="путь к базе (по умолчанию <report-dir>/reports.db)")
+    migrate.add_argument("--delete", action="store_true", help="удалить перенесённые файлы")
+    index = subparsers.add_parser("index", help="добавить существующие отчёты в индекс /history")
+    index.add_argument("--report-dir", default=os.path.join(os.path.dirname(os.path.realpath(__file__)), "report"))
+    index.add_argument("--db", help="база отчётов (по умолчанию <report-dir>/reports.db)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.report_dir):
+        print(f"Каталог отчётов не найден: {args.report_dir}")
+        sys.exit(1)
+    if args.command == "index":
+        report_index = ReportIndex(os.path.join(args.report_dir, "history.db"))
+        try:
+            indexed = rebuild_index(args.report_dir, report_index, args.db or os.path.join(args.report_dir, "reports.db"))
+        finally:
+            report_index.close()
+        print(f"Добавлено в индекс отчётов: {indexed}")
+        return
+    store = SqliteReportStore(args.db or os.path.join(args.report_dir, "reports.db"))
+    try:
+        migrated = migrate_files(args.report_dir, store, delete=args.delete)
+    finally:
+        store.close()
+    print(f"Перенесено отчётов: {migrated}")
+
+
+if __name__ == "__main__":
+    main()
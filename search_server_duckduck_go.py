@@ -1,15 +1,61 @@
 from mcp.server.fastmcp import FastMCP, Context
 import httpx
-from bs4 import BeautifulSoup
-from typing import List, Dict, Optional, Any
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import List, Dict, Optional, Any, Tuple, Iterator, Iterable, Callable, Awaitable
 from dataclasses import dataclass
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
 import urllib.parse
+import argparse
+import os
 import sys
 import traceback
 import asyncio
-from datetime import datetime, timedelta
+import dataclasses
+import json
+import sqlite3
+import threading
+import zlib
 import time
 import re
+import logging
+
+from telemetry import REGISTRY, serve_metrics
+from tracing import configure_export, configure_logging, current_trace, span, trace
+
+# Per-stage latency and outcome counters, exposed on DDG_METRICS_PORT
+STAGE_SECONDS = REGISTRY.histogram(
+    "ddg_search_stage_seconds", "Time spent in each search stage (rate_limit_wait, http_post, parse, format)"
+)
+SEARCHES = REGISTRY.counter("ddg_searches_total", "Searches by where the results came from")
+SEARCH_ERRORS = REGISTRY.counter("ddg_search_errors_total", "Failed searches by error kind")
+HTTP_RESPONSES = REGISTRY.counter("ddg_http_responses_total", "DuckDuckGo responses by HTTP status")
+
+logger = logging.getLogger("ddg_search")
+
+
+@contextmanager
+def _stage(name: str):
+    """Time a pipeline stage into STAGE_SECONDS and the current trace"""
+    with STAGE_SECONDS.time(stage=name), span(name):
+        yield
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
 
 
 @dataclass
@@ -20,25 +66,554 @@ class SearchResult:
     position: int
 
 
+@dataclass
+class ParsedPage:
+    results: List[SearchResult]
+    # Hidden fields of the "next page" form, if the parser reached it
+    next_params: Optional[Dict[str, str]] = None
+
+
+def _page_offset(params: Dict[str, str]) -> int:
+    try:
+        return int(params.get("s") or 0)
+    except ValueError:
+        return 0
+
+
+class ResultParser:
+    """Extracts search results from a raw DuckDuckGo HTML page.
+
+    Backends only implement ``_scan``, which yields ``(title, href, snippet)``
+    for every ``.result`` block with a title link and a dict of hidden inputs
+    for every ``.nav-link`` form. Ad filtering, redirect cleanup, numbering
+    and picking the "next page" form are shared, so all backends produce the
+    same ``ParsedPage``.
+
+    With ``early_stop`` the page is fed to ``_scan`` in chunks and scanning
+    stops as soon as ``max_results`` results are collected; backends that can
+    parse incrementally then never look at the rest of the page.
+    """
+
+    name = "base"
+    CHUNK_SIZE = 4 * 1024
+
+    def __init__(self, early_stop: bool = True):
+        self.early_stop = early_stop
+
+    def _scan(self, chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[Any]:
+        raise NotImplementedError
+
+    def _chunks(self, content: bytes) -> Iterator[bytes]:
+        if not self.early_stop:
+            yield content
+            return
+        for start in range(0, len(content), self.CHUNK_SIZE):
+            yield content[start:start + self.CHUNK_SIZE]
+
+    def parse(
+        self, content: bytes, encoding: Optional[str] = None, max_results: int = 10
+    ) -> ParsedPage:
+        results = []
+        next_params = None
+        for item in self._scan(self._chunks(content), encoding):
+            if isinstance(item, dict):
+                # Pages past the first also carry a "previous" form; keep the furthest one
+                if next_params is None or _page_offset(item) > _page_offset(next_params):
+                    next_params = item
+                continue
+
+            title, link, snippet = item
+
+            # Skip ad results
+            if "y.js" in link:
+                continue
+
+            # Clean up DuckDuckGo redirect URLs
+            if link.startswith("//duckduckgo.com/l/?uddg="):
+                link = urllib.parse.unquote(link.split("uddg=")[1].split("&")[0])
+
+            results.append(
+                SearchResult(
+                    title=title,
+                    link=link,
+                    snippet=snippet,
+                    position=len(results) + 1,
+                )
+            )
+
+            if len(results) >= max_results:
+                break
+
+        return ParsedPage(results, next_params)
+
+
+class SoupResultParser(ResultParser):
+    """Pure-Python fallback built on BeautifulSoup and ``html.parser``.
+
+    ``html.parser`` cannot be stopped midway, so with ``early_stop`` only the
+    ``.result`` blocks are materialized (via ``SoupStrainer``) instead of the
+    whole document tree.
+    """
+
+    name = "bs4"
+    # The strainer may see the raw class string, so match the classes as words
+    STRAINED_CLASSES = re.compile(r"(^|\s)(result|nav-link)(\s|$)")
+
+    def _scan(self, chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[Any]:
+        # Decode exactly like httpx's ``response.text`` does
+        markup = b"".join(chunks).decode(encoding or "utf-8", errors="replace")
+        parse_only = SoupStrainer(class_=self.STRAINED_CLASSES) if self.early_stop else None
+        soup = BeautifulSoup(markup, "html.parser", parse_only=parse_only)
+        for result in soup.select(".result"):
+            title_elem = result.select_one(".result__title")
+            if not title_elem:
+                continue
+
+            link_elem = title_elem.find("a")
+            if not link_elem:
+                continue
+
+            snippet_elem = result.select_one(".result__snippet")
+            yield (
+                link_elem.get_text(strip=True),
+                link_elem.get("href", ""),
+                snippet_elem.get_text(strip=True) if snippet_elem else "",
+            )
+
+        for form in soup.select(".nav-link form"):
+            yield {
+                field["name"]: field.get("value", "")
+                for field in form.select("input[type=hidden][name]")
+            }
+
+
+def _class_xpath(class_name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+class LxmlResultParser(ResultParser):
+    """libxml2-backed parser that reads the response bytes directly.
+
+    With ``early_stop`` the page is pushed through ``HTMLPullParser`` chunk by
+    chunk and each ``.result`` block is extracted as soon as it is closed.
+    """
+
+    name = "lxml"
+
+    def __init__(self, early_stop: bool = True):
+        super().__init__(early_stop)
+        from lxml import etree
+
+        self._etree = etree
+        self._results = etree.XPath(f"//*[{_class_xpath('result')}]")
+        self._title_link = etree.XPath(f"(.//*[{_class_xpath('result__title')}])[1]//a[1]")
+        self._snippet = etree.XPath(f"(.//*[{_class_xpath('result__snippet')}])[1]")
+        self._texts = etree.XPath(".//text()")
+        self._nav_forms = etree.XPath(f"//*[{_class_xpath('nav-link')}]//form")
+        self._hidden_fields = etree.XPath(".//input[@type='hidden'][@name]")
+
+    def _form_params(self, form) -> Dict[str, str]:
+        return {field.get("name"): field.get("value", "") for field in self._hidden_fields(form)}
+
+    def _text(self, elem) -> str:
+        # Same as BeautifulSoup's get_text(strip=True): strip and join text nodes
+        return "".join(text.strip() for text in self._texts(elem))
+
+    def _extract(self, result) -> Optional[Tuple[str, str, str]]:
+        links = self._title_link(result)
+        if not links:
+            return None
+        snippets = self._snippet(result)
+        return (
+            self._text(links[0]),
+            links[0].get("href", ""),
+            self._text(snippets[0]) if snippets else "",
+        )
+
+    def _scan(self, chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[Any]:
+        if not self.early_stop:
+            parser = self._etree.HTMLParser(encoding=encoding)
+            root = self._etree.fromstring(b"".join(chunks), parser)
+            if root is None:
+                return
+            for result in self._results(root):
+                item = self._extract(result)
+                if item is not None:
+                    yield item
+            for form in self._nav_forms(root):
+                yield self._form_params(form)
+            return
+
+        parser = self._etree.HTMLPullParser(events=("end",), encoding=encoding)
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from self._read_results(parser)
+        parser.close()
+        yield from self._read_results(parser)
+
+    def _read_results(self, parser) -> Iterator[Any]:
+        for _, elem in parser.read_events():
+            if elem.tag == "form":
+                parent = elem.getparent()
+                while parent is not None:
+                    parent_classes = parent.get("class")
+                    if parent_classes and "nav-link" in parent_classes.split():
+                        yield self._form_params(elem)
+                        break
+                    parent = parent.getparent()
+                continue
+
+            classes = elem.get("class")
+            if classes and "result" in classes.split():
+                item = self._extract(elem)
+                if item is not None:
+                    yield item
+
+
+class SelectolaxResultParser(ResultParser):
+    """Lexbor-backed parser from the ``selectolax`` package"""
+
+    name = "selectolax"
+
+    def __init__(self, early_stop: bool = True):
+        super().__init__(early_stop)
+        from selectolax.lexbor import LexborHTMLParser
+
+        self._parser_cls = LexborHTMLParser
+
+    def _scan(self, chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[Any]:
+        # Lexbor has no incremental API; it is fast enough to parse the whole page
+        content = b"".join(chunks)
+        if encoding and encoding.lower().replace("_", "-") not in ("utf-8", "utf8", "ascii"):
+            content = content.decode(encoding, errors="replace").encode("utf-8")
+        tree = self._parser_cls(content)
+        for result in tree.css(".result"):
+            title_elem = result.css_first(".result__title")
+            if title_elem is None:
+                continue
+
+            link_elem = title_elem.css_first("a")
+            if link_elem is None:
+                continue
+
+            snippet_elem = result.css_first(".result__snippet")
+            yield (
+                link_elem.text(deep=True, separator="", strip=True),
+                link_elem.attributes.get("href") or "",
+                snippet_elem.text(deep=True, separator="", strip=True) if snippet_elem is not None else "",
+            )
+
+        for form in tree.css(".nav-link form"):
+            yield {
+                field.attributes["name"]: field.attributes.get("value") or ""
+                for field in form.css("input[type=hidden][name]")
+            }
+
+
+PARSERS = {
+    parser_cls.name: parser_cls
+    for parser_cls in (SelectolaxResultParser, LxmlResultParser, SoupResultParser)
+}
+
+
+def make_parser(name: str = "auto", early_stop: bool = True) -> ResultParser:
+    """Create a result parser by name; "auto" picks the fastest installed one"""
+    candidates = list(PARSERS) if name == "auto" else [name]
+    for candidate in candidates:
+        parser_cls = PARSERS.get(candidate)
+        if parser_cls is None:
+            print(f"Unknown result parser '{candidate}'", file=sys.stderr)
+            continue
+        try:
+            return parser_cls(early_stop)
+        except ImportError:
+            if name != "auto":
+                print(f"Result parser '{candidate}' is not installed", file=sys.stderr)
+    return SoupResultParser(early_stop)
+
+
 class RateLimiter:
-    def __init__(self, requests_per_minute: int = 30):
+    """Token bucket limiter.
+
+    Tokens refill continuously at ``requests_per_minute / 60`` per second up to
+    ``burst``. Waiters queue on an asyncio lock, so they are served in FIFO
+    order and each acquire costs O(1) regardless of how many are waiting.
+    A non-positive ``requests_per_minute`` disables limiting.
+
+    Any rolling minute admits at most ``requests_per_minute + burst``
+    requests, so the default burst is kept small; a burst below 1 could
+    never grant a token and is raised to 1.
+    """
+
+    DEFAULT_BURST = 3
+
+    def __init__(self, requests_per_minute: int = 30, burst: Optional[int] = None):
         self.requests_per_minute = requests_per_minute
-        self.requests = []
+        if burst is None:
+            burst = min(self.DEFAULT_BURST, requests_per_minute)
+        self.burst = max(1, burst)
+        self._rate = requests_per_minute / 60.0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
 
     async def acquire(self):
-        now = datetime.now()
-        # Remove requests older than 1 minute
-        self.requests = [
-            req for req in self.requests if now - req < timedelta(minutes=1)
+        if self._rate <= 0:
+            return
+
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                # Holding the lock while sleeping keeps later waiters queued behind us
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class _CacheEntry:
+    __slots__ = ("expires_at", "size", "results", "renderings")
+
+    def __init__(self, expires_at: float, size: int, results: Tuple[SearchResult, ...]):
+        self.expires_at = expires_at
+        self.size = size
+        self.results = results
+        # Output format -> text rendered from these results
+        self.renderings: Dict[str, str] = {}
+
+
+class SearchCache:
+    """In-memory TTL cache of search results with LRU eviction.
+
+    Entries are keyed on the normalized query and ``max_results`` and bounded
+    both by count and by an approximate size in bytes. Each entry also keeps
+    the tool output already rendered from its results, per output format.
+    """
+
+    # Rough per-result overhead of the dataclass and its strings
+    RESULT_OVERHEAD = 200
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int], _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(query: str, max_results: int) -> Tuple[str, int]:
+        return " ".join(query.casefold().split()), max_results
+
+    @classmethod
+    def _estimate_size(cls, results: List[SearchResult]) -> int:
+        return sum(
+            len(r.title) + len(r.link) + len(r.snippet) + cls.RESULT_OVERHEAD
+            for r in results
+        )
+
+    def _live_entry(self, key: Tuple[str, int]) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, key: Tuple[str, int]) -> Optional[List[SearchResult]]:
+        entry = self._live_entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(entry.results)
+
+    def put(self, key: Tuple[str, int], results: List[SearchResult]):
+        if not self.enabled:
+            return
+
+        size = self._estimate_size(results)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CacheEntry(time.monotonic() + self.ttl, size, tuple(results))
+        self._bytes += size
+        self._evict()
+
+    def get_rendering(self, key: Tuple[str, int], output_format: str) -> Optional[str]:
+        entry = self._live_entry(key)
+        return entry.renderings.get(output_format) if entry is not None else None
+
+    def put_rendering(self, key: Tuple[str, int], output_format: str, text: str):
+        entry = self._live_entry(key)
+        if entry is None or output_format in entry.renderings:
+            return
+        entry.renderings[output_format] = text
+        entry.size += len(text)
+        self._bytes += len(text)
+        self._evict()
+
+    def _evict(self):
+        # Evict least recently used entries until both budgets are met
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: Tuple[str, int]):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class SqliteSearchCache:
+    """Persistent search cache tier stored in SQLite.
+
+    The database runs in WAL mode with a busy timeout, so several server
+    processes can share one file. Results are stored as zlib-compressed JSON
+    rows of ``[title, link, snippet]``; positions follow the row order.
+    """
+
+    # How many writes happen between eviction passes
+    EVICT_EVERY = 64
+
+    def __init__(self, path: str, ttl: float = 86400.0, max_entries: int = 100_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS search_cache (
+                query TEXT NOT NULL,
+                max_results INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (query, max_results)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache (accessed_at)"
+        )
+
+    @staticmethod
+    def serialize(results: List[SearchResult]) -> bytes:
+        rows = [[r.title, r.link, r.snippet] for r in results]
+        return zlib.compress(
+            json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        )
+
+    @staticmethod
+    def deserialize(payload: bytes) -> List[SearchResult]:
+        rows = json.loads(zlib.decompress(payload).decode("utf-8"))
+        return [
+            SearchResult(title=title, link=link, snippet=snippet, position=i)
+            for i, (title, link, snippet) in enumerate(rows, start=1)
         ]
 
-        if len(self.requests) >= self.requests_per_minute:
-            # Wait until we can make another request
-            wait_time = 60 - (now - self.requests[0]).total_seconds()
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
+    def _get(self, key: Tuple[str, int]) -> Optional[List[SearchResult]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM search_cache WHERE query = ? AND max_results = ?",
+                key,
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE search_cache SET accessed_at = ? WHERE query = ? AND max_results = ?",
+                (now, *key),
+            )
+            self.hits += 1
+        return self.deserialize(row[0])
+
+    def _put(self, key: Tuple[str, int], results: List[SearchResult]):
+        payload = self.serialize(results)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)",
+                (*key, now + self.ttl, now, payload),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (now,))
+        # Keep only the most recently used max_entries rows
+        self._conn.execute(
+            """
+            DELETE FROM search_cache WHERE accessed_at < (
+                SELECT accessed_at FROM search_cache
+                ORDER BY accessed_at DESC LIMIT 1 OFFSET ?
+            )
+            """,
+            (self.max_entries - 1,),
+        )
+
+    async def get(self, key: Tuple[str, int]) -> Optional[List[SearchResult]]:
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except sqlite3.Error as e:
+            print(f"Search cache read failed: {e}", file=sys.stderr)
+            return None
+
+    async def put(self, key: Tuple[str, int], results: List[SearchResult]):
+        try:
+            await asyncio.to_thread(self._put, key, results)
+        except sqlite3.Error as e:
+            print(f"Search cache write failed: {e}", file=sys.stderr)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
 
-        self.requests.append(now)
+OUTPUT_FORMATS = ("text", "json", "compact")
 
 
 class DuckDuckGoSearcher:
@@ -47,8 +622,73 @@ class DuckDuckGoSearcher:
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
 
-    def __init__(self):
-        self.rate_limiter = RateLimiter()
+    def __init__(
+        self,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        timeout: float = 30.0,
+        cache: Optional[SearchCache] = None,
+        disk_cache: Optional[SqliteSearchCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        parser: Optional[ResultParser] = None,
+        max_pages: int = 5,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        base_url: Optional[str] = None,
+    ):
+        # Another endpoint serving DuckDuckGo-shaped pages, e.g. benchmarks/ddg_stub.py
+        self.base_url = base_url or self.BASE_URL
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.parser = parser if parser is not None else make_parser()
+        self.max_pages = max_pages
+        self.cache = cache if cache is not None else SearchCache()
+        self.disk_cache = disk_cache
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.timeout = timeout
+        # Custom transport, e.g. httpx.MockTransport serving recorded pages in benchmarks
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[Tuple[str, int], "asyncio.Future[List[SearchResult]]"] = {}
+        # Trace id of the caller whose context runs each in-flight task
+        self._inflight_traces: Dict[Tuple[str, int], Optional[str]] = {}
+        self._progress: Dict[Tuple[str, int], List[Callable[[List[SearchResult]], Awaitable[None]]]] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared keep-alive client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print(
+                        "HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1",
+                        file=sys.stderr,
+                    )
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                headers=self.HEADERS,
+                limits=self.limits,
+                http2=http2,
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close the shared client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.disk_cache is not None:
+            self.disk_cache.close()
+            self.disk_cache = None
 
     def format_results_for_llm(self, results: List[SearchResult]) -> str:
         """Format results in a natural language style that's easier for LLMs to process"""
@@ -57,7 +697,13 @@ class DuckDuckGoSearcher:
 
         output = []
         output.append(f"Found {len(results)} search results:\n")
+        output.append(self.format_result_lines(results))
 
+        return "\n".join(output)
+
+    def format_result_lines(self, results: List[SearchResult]) -> str:
+        """Format results the way format_results_for_llm lists them, without the header"""
+        output = []
         for result in results:
             output.append(f"{result.position}. {result.title}")
             output.append(f"   URL: {result.link}")
@@ -66,111 +712,501 @@ class DuckDuckGoSearcher:
 
         return "\n".join(output)
 
-    async def search(
-        self, query: str, ctx: Context, max_results: int = 10
-    ) -> List[SearchResult]:
-        try:
-            await self.rate_limiter.acquire()
+    def format_results_as_json(self, results: List[SearchResult]) -> str:
+        """Format results as a JSON document for programmatic consumers"""
+        return json.dumps(
+            {"results": [dataclasses.asdict(result) for result in results]},
+            ensure_ascii=False,
+        )
 
-            data = {
-                "q": query,
-                "b": "",
-                "kl": "",
-            }
+    def format_results_compact(self, results: List[SearchResult]) -> str:
+        """Format results as one short line per result"""
+        if not results:
+            return "No results."
+        return "\n".join(f"{result.position}. {result.title} - {result.link}" for result in results)
 
-            await ctx.info(f"Searching DuckDuckGo for: {query}")
+    def render(
+        self, results: List[SearchResult], output_format: str = "text", cache_key: Optional[Tuple[str, int]] = None
+    ) -> str:
+        """Render results in the given output format, reusing the rendering cached with them"""
+        formatter = {
+            "text": self.format_results_for_llm,
+            "json": self.format_results_as_json,
+            "compact": self.format_results_compact,
+        }.get(output_format)
+        if formatter is None:
+            raise ValueError(f"Unknown output format '{output_format}' (expected one of: {', '.join(OUTPUT_FORMATS)})")
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.BASE_URL, data=data, headers=self.HEADERS, timeout=30.0
-                )
-                response.raise_for_status()
+        if cache_key is not None and results:
+            rendered = self.cache.get_rendering(cache_key, output_format)
+            if rendered is not None:
+                return rendered
 
-            soup = BeautifulSoup(response.text, "html.parser")
-            if not soup:
-                await ctx.error("Failed to parse HTML response")
-                return []
+        with _stage("format"):
+            rendered = formatter(results)
+        if cache_key is not None and results:
+            self.cache.put_rendering(cache_key, output_format, rendered)
+        return rendered
 
-            results = []
-            for result in soup.select(".result"):
-                title_elem = result.select_one(".result__title")
-                if not title_elem:
-                    continue
+    async def _fetch_page(self, data: Dict[str, str], max_results: int) -> ParsedPage:
+        with _stage("rate_limit_wait"):
+            await self.rate_limiter.acquire()
 
-                link_elem = title_elem.find("a")
-                if not link_elem:
-                    continue
+        client = self._get_client()
+        with _stage("http_post"):
+            response = await client.post(self.base_url, data=data)
+        HTTP_RESPONSES.inc(status=response.status_code)
+        response.raise_for_status()
 
-                title = link_elem.get_text(strip=True)
-                link = link_elem.get("href", "")
+        with _stage("parse"):
+            return self.parser.parse(response.content, response.encoding, max_results)
 
-                # Skip ad results
-                if "y.js" in link:
+    async def _fetch(self, query: str, max_results: int) -> List[SearchResult]:
+        """Run the DuckDuckGo requests for one search and parse the results.
+
+        When the first page has fewer than ``max_results`` results, the
+        following pages are requested in parallel. Their ``s``/``dc`` offsets
+        are extrapolated from the page's "next" form. Results are deduplicated
+        by URL, and every page request takes a rate limiter slot. If a later
+        page fails, the results so far are returned but not cached.
+        """
+        data = {
+            "q": query,
+            "b": "",
+            "kl": "",
+        }
+        page = await self._fetch_page(data, max_results)
+
+        results = []
+        seen = set()
+
+        def merge(page_results: List[SearchResult]):
+            for result in page_results:
+                if result.link in seen or len(results) >= max_results:
                     continue
+                seen.add(result.link)
+                results.append(dataclasses.replace(result, position=len(results) + 1))
 
-                # Clean up DuckDuckGo redirect URLs
-                if link.startswith("//duckduckgo.com/l/?uddg="):
-                    link = urllib.parse.unquote(link.split("uddg=")[1].split("&")[0])
+        merge(page.results)
+        per_page = len(page.results)
+        offset = 0
+        pages = 1
+        next_params = page.next_params
+        cache_key = self.cache.make_key(query, max_results)
+        reported = 0
+        complete = True
 
-                snippet_elem = result.select_one(".result__snippet")
-                snippet = snippet_elem.get_text(strip=True) if snippet_elem else ""
+        while len(results) < max_results and next_params and pages < self.max_pages and per_page:
+            # More pages are needed: hand the results so far to waiting callers first
+            await self._report_progress(cache_key, results[reported:])
+            reported = len(results)
 
-                results.append(
-                    SearchResult(
-                        title=title,
-                        link=link,
-                        snippet=snippet,
-                        position=len(results) + 1,
-                    )
-                )
+            next_offset = _page_offset(next_params)
+            if next_offset <= offset:
+                break
+            stride = next_offset - offset
+            try:
+                dc_delta = int(next_params.get("dc") or next_offset + 1) - next_offset
+            except ValueError:
+                # Unknown form layout: keep the results so far
+                break
+            batch = min(-(-(max_results - len(results)) // per_page), self.max_pages - pages)
+
+            batch_params = []
+            for i in range(batch):
+                page_offset = next_offset + i * stride
+                params = dict(next_params, s=str(page_offset))
+                if "dc" in next_params:
+                    params["dc"] = str(page_offset + dc_delta)
+                batch_params.append(params)
 
-                if len(results) >= max_results:
+            fetched = await asyncio.gather(
+                *(self._fetch_page(params, max_results) for params in batch_params),
+                return_exceptions=True,
+            )
+            next_params = None
+            for page_offset, page in zip((_page_offset(p) for p in batch_params), fetched):
+                if isinstance(page, BaseException):
+                    # Keep what the earlier pages returned
+                    print(f"Fetching results page at offset {page_offset} failed: {page!r}", file=sys.stderr)
+                    complete = False
+                    break
+                merge(page.results)
+                offset = page_offset
+                next_params = page.next_params
+                if not page.results:
+                    next_params = None
                     break
+            pages += batch
+
+        # A page that failed would make a short list look complete until it expires
+        if results and complete:
+            self.cache.put(cache_key, results)
+            if self.disk_cache is not None:
+                await self.disk_cache.put(cache_key, results)
+        return results
+
+    async def _report_progress(self, cache_key: Tuple[str, int], new_results: List[SearchResult]):
+        if not new_results:
+            return
+        for callback in list(self._progress.get(cache_key, ())):
+            try:
+                await callback(new_results)
+            except Exception as e:
+                print(f"Progress notification failed: {e!r}", file=sys.stderr)
+
+    async def _fetch_shared(
+        self,
+        cache_key: Tuple[str, int],
+        query: str,
+        max_results: int,
+        on_results: Optional[Callable[[List[SearchResult]], Awaitable[None]]] = None,
+    ) -> List[SearchResult]:
+        """Coalesce concurrent identical searches into one in-flight request.
+
+        Every caller awaits the same task and gets its result or exception.
+        The task is shielded, so a cancelled caller does not abort the
+        request for the others. ``on_results`` receives the results of
+        earlier pages while later ones are still being fetched.
+
+        The task runs in the first caller's context, so its rate_limit_wait,
+        http_post and parse spans belong to that caller's trace only; the
+        others record a "coalesced" span pointing at it (``leader_trace``).
+        """
+        if on_results is not None:
+            self._progress.setdefault(cache_key, []).append(on_results)
+            try:
+                return await self._fetch_shared(cache_key, query, max_results)
+            finally:
+                callbacks = self._progress[cache_key]
+                callbacks.remove(on_results)
+                if not callbacks:
+                    del self._progress[cache_key]
+
+        task = self._inflight.get(cache_key)
+        if task is not None:
+            with span("coalesced", leader_trace=self._inflight_traces.get(cache_key)):
+                return list(await asyncio.shield(task))
 
+        task = asyncio.ensure_future(self._fetch(query, max_results))
+        self._inflight[cache_key] = task
+        self._inflight_traces[cache_key] = current_trace.get()
+
+        def _done(t: "asyncio.Future[List[SearchResult]]"):
+            if self._inflight.get(cache_key) is t:
+                del self._inflight[cache_key]
+                self._inflight_traces.pop(cache_key, None)
+            # Mark the exception retrieved in case every caller was cancelled
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(_done)
+        return list(await asyncio.shield(task))
+
+    async def search(
+        self, query: str, ctx: Context, max_results: int = 10, report_progress: bool = False
+    ) -> List[SearchResult]:
+        """Search with caching and coalescing; errors are logged to ``ctx`` and yield [].
+
+        With ``report_progress``, results of the first pages are sent as MCP
+        progress notifications (message = the new results in text format)
+        while further pages are fetched. They reach clients that passed a
+        progress callback.
+        """
+        on_results = None
+        if report_progress:
+            found = 0
+
+            async def on_results(new_results: List[SearchResult]):
+                nonlocal found
+                found += len(new_results)
+                await ctx.report_progress(found, max_results, self.format_result_lines(new_results))
+
+        try:
+            cache_key = self.cache.make_key(query, max_results)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                SEARCHES.inc(source="memory_cache")
+                await ctx.info(f"Returning cached results for: {query}")
+                return cached
+
+            if self.disk_cache is not None:
+                cached = await self.disk_cache.get(cache_key)
+                if cached is not None:
+                    self.cache.put(cache_key, cached)
+                    SEARCHES.inc(source="disk_cache")
+                    await ctx.info(f"Returning cached results for: {query}")
+                    return cached
+
+            SEARCHES.inc(source="duckduckgo")
+            await ctx.info(f"Searching DuckDuckGo for: {query}")
+
+            results = await self._fetch_shared(cache_key, query, max_results, on_results)
             await ctx.info(f"Successfully found {len(results)} results")
             return results
 
         except httpx.TimeoutException:
+            SEARCH_ERRORS.inc(kind="timeout")
             await ctx.error("Search request timed out")
             return []
         except httpx.HTTPError as e:
+            SEARCH_ERRORS.inc(kind="http")
             await ctx.error(f"HTTP error occurred: {str(e)}")
             return []
         except Exception as e:
+            SEARCH_ERRORS.inc(kind="unexpected")
             await ctx.error(f"Unexpected error during search: {str(e)}")
             traceback.print_exc(file=sys.stderr)
             return []
 
 
+# Over stdio the process serves exactly one session; the network transports
+# serve many sessions from one warm searcher and close it when the server stops
+shared_searcher = False
+_metrics_server: Optional[asyncio.AbstractServer] = None
+
+
+async def _start_metrics():
+    """Serve the Prometheus metrics once per process if DDG_METRICS_PORT is set"""
+    global _metrics_server
+    port = _env_int("DDG_METRICS_PORT", 0)
+    if port <= 0 or _metrics_server is not None:
+        return
+    try:
+        _metrics_server = await serve_metrics(port, os.getenv("DDG_METRICS_HOST", "127.0.0.1"))
+    except OSError as e:
+        print(f"Metrics endpoint on port {port} failed: {e}", file=sys.stderr)
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    await _start_metrics()
+    try:
+        yield
+    finally:
+        # Release pooled keep-alive connections on server shutdown
+        if not shared_searcher:
+            await searcher.aclose()
+
+
+def _open_disk_cache() -> Optional[SqliteSearchCache]:
+    path = os.getenv("DDG_CACHE_DB")
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
+    return SqliteSearchCache(
+        path,
+        ttl=_env_float("DDG_CACHE_DB_TTL", 86400.0),
+        max_entries=_env_int("DDG_CACHE_DB_MAX_ENTRIES", 100_000),
+    )
+
+
+MAX_BATCH_QUERIES = _env_int("DDG_MAX_BATCH_QUERIES", 20)
+
 # Initialize FastMCP server
-mcp = FastMCP("ddg-search")
+mcp = FastMCP("ddg-search", lifespan=lifespan)
 try:
-    searcher = DuckDuckGoSearcher()
+    searcher = DuckDuckGoSearcher(
+        max_connections=_env_int("DDG_MAX_CONNECTIONS", 10),
+        max_keepalive_connections=_env_int("DDG_MAX_KEEPALIVE_CONNECTIONS", 10),
+        keepalive_expiry=_env_float("DDG_KEEPALIVE_EXPIRY", 30.0),
+        http2=_env_bool("DDG_HTTP2", False),
+        timeout=_env_float("DDG_TIMEOUT", 30.0),
+        base_url=os.environ.get("DDG_BASE_URL") or None,
+        cache=SearchCache(
+            ttl=_env_float("DDG_CACHE_TTL", 300.0),
+            max_entries=_env_int("DDG_CACHE_MAX_ENTRIES", 1024),
+            max_bytes=_env_int("DDG_CACHE_MAX_BYTES", 8 * 1024 * 1024),
+        ),
+        disk_cache=_open_disk_cache(),
+        parser=make_parser(
+            os.getenv("DDG_PARSER", "auto"),
+            early_stop=_env_bool("DDG_PARSE_EARLY_STOP", True),
+        ),
+        max_pages=_env_int("DDG_MAX_PAGES", 5),
+        rate_limiter=RateLimiter(
+            requests_per_minute=_env_int("DDG_REQUESTS_PER_MINUTE", 30),
+            burst=_env_int("DDG_RATE_BURST", 0) or None,
+        ),
+    )
     print("mcp initialized")
 except Exception as e:
     print(f"Error initializing searcher: {str(e)}")
 
+
+# Trace ids are client input (any client of a shared server can send _meta)
+_TRACE_ID_RE = re.compile(r"[0-9a-f]{1,32}")
+
+
+def _request_trace_id(ctx) -> Optional[str]:
+    """The trace_id the client put into the request _meta, if any and well-formed"""
+    try:
+        meta = ctx.request_context.meta
+    except (AttributeError, ValueError):
+        return None
+    trace_id = getattr(meta, "trace_id", None) if meta is not None else None
+    if isinstance(trace_id, str) and _TRACE_ID_RE.fullmatch(trace_id):
+        return trace_id
+    return None
+
+
+class _LoggingContext:
+    """Sends ctx log messages to the client and also logs them here, where records carry the trace id"""
+
+    def __init__(self, ctx: Context):
+        self._ctx = ctx
+
+    async def info(self, message: str, **extra):
+        logger.info(message)
+        await self._ctx.info(message, **extra)
+
+    async def error(self, message: str, **extra):
+        logger.error(message)
+        await self._ctx.error(message, **extra)
+
+    def __getattr__(self, name: str):
+        return getattr(self._ctx, name)
+
+
+def _traced(ctx):
+    # Contexts of in-process callers already log locally
+    return _LoggingContext(ctx) if isinstance(ctx, Context) else ctx
+
+
+REGISTRY.gauge("ddg_cache", "In-memory search cache statistics", lambda: searcher.cache.stats(), label="stat")
+REGISTRY.gauge(
+    "ddg_disk_cache",
+    "SQLite search cache statistics",
+    lambda: searcher.disk_cache.stats() if searcher.disk_cache is not None else {},
+    label="stat",
+)
+REGISTRY.gauge("ddg_searches_in_flight", "Distinct DuckDuckGo searches in progress", lambda: len(searcher._inflight))
+
+
 @mcp.tool()
-async def search(query: str, ctx: Context, max_results: int = 10) -> str:
+async def search(query: str, ctx: Context, max_results: int = 10, output_format: str = "text") -> str:
     """
     Search DuckDuckGo and return formatted results.
 
     Args:
         query: The search query string
         max_results: Maximum number of results to return (default: 10)
+        output_format: "text" (default), "json" with title/link/snippet/position per result, or "compact"
         ctx: MCP context for logging
     """
+    if output_format not in OUTPUT_FORMATS:
+        return f"Unknown output format '{output_format}' (expected one of: {', '.join(OUTPUT_FORMATS)})."
+
+    with trace(_request_trace_id(ctx)), span("search", query=query, max_results=max_results):
+        try:
+            results = await searcher.search(query, _traced(ctx), max_results, report_progress=True)
+            return searcher.render(results, output_format, searcher.cache.make_key(query, max_results))
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            return f"An error occurred while searching: {str(e)}"
+
+
+@mcp.tool()
+async def search_many(
+    queries: List[str], ctx: Context, max_results: int = 10, output_format: str = "text"
+) -> str:
+    """
+    Search DuckDuckGo for several queries at once and return formatted results for each.
+
+    Args:
+        queries: The search query strings
+        max_results: Maximum number of results to return per query (default: 10)
+        output_format: "text" (default), "json" or "compact"; with "json" the response is
+            {"searches": [{"query": ..., "response": {"results": [...]} or {"error": ...}}]}
+        ctx: MCP context for logging
+    """
+    if len(queries) > MAX_BATCH_QUERIES:
+        return f"Too many queries: {len(queries)} (at most {MAX_BATCH_QUERIES} per call)."
+    if output_format not in OUTPUT_FORMATS:
+        return f"Unknown output format '{output_format}' (expected one of: {', '.join(OUTPUT_FORMATS)})."
+
+    async def search_one(query: str) -> str:
+        # Errors stay local to their query so the rest of the batch still answers
+        try:
+            with span("search_one", query=query):
+                results = await searcher.search(query, _traced(ctx), max_results)
+            return searcher.render(results, output_format, searcher.cache.make_key(query, max_results))
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            message = f"An error occurred while searching: {str(e)}"
+            return json.dumps({"error": message}, ensure_ascii=False) if output_format == "json" else message
+
+    with trace(_request_trace_id(ctx)), span("search_many", queries=len(queries)):
+        outputs = await asyncio.gather(*(search_one(query) for query in queries))
+    if output_format == "json":
+        # Splice the cached per-query JSON renderings in without re-encoding them
+        searches = ",".join(
+            f'{{"query":{json.dumps(query, ensure_ascii=False)},"response":{output}}}'
+            for query, output in zip(queries, outputs)
+        )
+        return f'{{"searches":[{searches}]}}'
+    return "\n\n".join(
+        f"## Results for: {query}\n\n{output}" for query, output in zip(queries, outputs)
+    )
+
+
+@mcp.tool()
+async def cache_stats() -> str:
+    """
+    Report search cache statistics: entries, size and hit/miss counters.
+    """
+    lines = [f"{name}: {value}" for name, value in searcher.cache.stats().items()]
+    if searcher.disk_cache is not None:
+        lines.extend(
+            f"disk_{name}: {value}" for name, value in searcher.disk_cache.stats().items()
+        )
+    return "\n".join(lines)
+
+
+async def serve_http(transport: str, host: str, port: int, uds: Optional[str] = None):
+    """Serve the MCP app over streamable HTTP or SSE on a TCP port or a Unix socket"""
+    import uvicorn
+
+    global shared_searcher
+    shared_searcher = True
+
+    if uds:
+        from mcp.server.transport_security import TransportSecuritySettings
+
+        # Only local processes can reach the socket, and clients send arbitrary Host headers over it
+        mcp.settings.transport_security = TransportSecuritySettings(enable_dns_rebinding_protection=False)
+
+    await _start_metrics()
+    app = mcp.streamable_http_app() if transport == "streamable-http" else mcp.sse_app()
+    config = uvicorn.Config(app, host=host, port=port, uds=uds, log_level="warning")
     try:
-        results = await searcher.search(query, ctx, max_results)
-        return searcher.format_results_for_llm(results)
-    except Exception as e:
-        traceback.print_exc(file=sys.stderr)
-        return f"An error occurred while searching: {str(e)}"
+        await uvicorn.Server(config).serve()
+    finally:
+        await searcher.aclose()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="DuckDuckGo search MCP server")
+    parser.add_argument(
+        "--transport",
+        choices=("stdio", "streamable-http", "sse"),
+        default=os.getenv("DDG_TRANSPORT", "stdio"),
+    )
+    parser.add_argument("--host", default=os.getenv("DDG_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=_env_int("DDG_PORT", 8000))
+    parser.add_argument("--uds", default=os.getenv("DDG_UDS"), help="Unix socket path instead of host/port")
+    args = parser.parse_args()
+
+    configure_logging(os.getenv("DDG_LOG_LEVEL"))
+    configure_export(os.getenv("DDG_TRACE_FILE"), f"ddg-search {os.getpid()}")
     print("Запуск сервера DuckDuckGo...")
-    mcp.run(transport="stdio")
+    if args.transport == "stdio":
+        mcp.run(transport="stdio")
+    else:
+        where = args.uds or f"http://{args.host}:{args.port}"
+        print(f"MCP endpoint ({args.transport}): {where}", file=sys.stderr)
+        asyncio.run(serve_http(args.transport, args.host, args.port, args.uds))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+"""
+Minimal in-process metrics with a Prometheus text endpoint.
+
+Used by both the bot and the search server. Metrics live in a Registry
+(``REGISTRY`` by default) and are rendered in the Prometheus text
+exposition format by ``serve_metrics``, a small asyncio HTTP server that
+answers every GET with the current values. No third-party dependencies.
+"""
+import asyncio
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Seconds; covers cache hits (microseconds) up to slow DuckDuckGo pages
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram; ``time()`` measures a block in seconds."""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (last one is +Inf), sum
+        self._series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(total[0])}"
+            yield f"{self.name}_count{_format_labels(key)} {cumulative}"
+
+
+class Gauge:
+    """Value read at scrape time from ``fn``: a number, or a dict of label dicts to numbers.
+
+    With ``label`` set, ``fn`` may return a plain dict such as a stats()
+    result; each numeric item becomes one sample labelled ``label=<key>``.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Union[float, dict]], kind: str = "gauge", label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+        self.label = label
+
+    def render(self) -> Iterator[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        if not isinstance(value, dict):
+            yield f"{self.name} {_format_value(value)}"
+            return
+        for key, item in value.items():
+            if isinstance(item, bool) or not isinstance(item, (int, float)):
+                continue
+            labels = _label_key({self.label: key}) if self.label else ()
+            yield f"{self.name}{_format_labels(labels)} {_format_value(item)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _add(self, metric):
+        # Re-registering (e.g. a module imported twice) returns the existing metric
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable, kind: str = "gauge", label: Optional[str] = None) -> Gauge:
+        # The callback is replaced, so it can be rebound to a new object (e.g. a new searcher)
+        gauge = Gauge(name, help, fn, kind, label)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+async def serve_metrics(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> asyncio.AbstractServer:
+    """Serve ``registry`` as Prometheus text on http://host:port/ (any path)."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if request_line.startswith(b"GET"):
+                body = registry.render().encode()
+                status = b"200 OK"
+            else:
+                body, status = b"method not allowed\n", b"405 Method Not Allowed"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
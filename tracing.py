@@ -0,0 +1,148 @@
+"""
+Request tracing shared by the bot and the search server.
+
+A trace id is created per user request (``new_trace_id``), made current for
+the handling task with ``trace()`` (a contextvar, so concurrent requests
+keep their own ids) and passed to the search server in the MCP request
+``_meta`` as ``trace_id``. ``TraceIdFilter`` stamps every log record with
+the current id, and ``span()`` records timings as Chrome Trace Event
+"complete" events, appended to a JSON array file that can be opened in
+chrome://tracing or https://ui.perfetto.dev. The closing bracket is never
+written (the format allows it), so the bot and the server processes can
+append to the same file.
+"""
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+current_trace: ContextVar[Optional[str]] = ContextVar("current_trace", default=None)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s [trace=%(trace_id)s] %(message)s"
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(8)
+
+
+@contextmanager
+def trace(trace_id: Optional[str]):
+    """Make ``trace_id`` current for the block; None keeps the current one"""
+    if trace_id is None:
+        yield current_trace.get()
+        return
+    token = current_trace.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        current_trace.reset(token)
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace.get() or "-"
+        return True
+
+
+def configure_logging(level: Optional[str] = None):
+    """Add the trace id to every record of the root handlers (creating one if there is none).
+
+    The root level is always set (WARNING by default): FastMCP has already
+    lowered it to INFO by the time this runs.
+    """
+    level = level or logging.WARNING
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=level, format=LOG_FORMAT)
+    else:
+        root.setLevel(level)
+    for handler in root.handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
+        if type(handler.formatter) in (type(None), logging.Formatter):
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+
+class TraceExporter:
+    """Appends Chrome Trace Event objects to ``path``, one line each.
+
+    Every event is a single O_APPEND write, so several processes can share
+    the file without interleaving.
+    """
+
+    def __init__(self, path: str, process_name: str):
+        self.path = path
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            os.write(fd, b"[\n")
+            os.close(fd)
+        except FileExistsError:
+            pass
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        self.write({"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": process_name}})
+
+    def write(self, event: dict):
+        line = (json.dumps(event, ensure_ascii=False, default=str) + ",\n").encode()
+        with self._lock:
+            if self._fd is not None:
+                os.write(self._fd, line)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+_exporter: Optional[TraceExporter] = None
+
+
+def configure_export(path: Optional[str], process_name: str) -> Optional[TraceExporter]:
+    """Start writing spans to ``path``; without a path spans are not recorded"""
+    global _exporter
+    if path and _exporter is None:
+        _exporter = TraceExporter(path, process_name)
+    return _exporter
+
+
+def close_export():
+    global _exporter
+    if _exporter is not None:
+        _exporter.close()
+        _exporter = None
+
+
+@contextmanager
+def span(name: str, **args):
+    """Record the block as a complete event of the current trace"""
+    if _exporter is None:
+        yield
+        return
+    trace_id = current_trace.get()
+    started_us = time.time_ns() // 1000
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _exporter.write(
+            {
+                "name": name,
+                "cat": "search",
+                "ph": "X",
+                "ts": started_us,
+                "dur": round((time.perf_counter() - started) * 1e6, 1),
+                "pid": _exporter.pid,
+                # One row per trace in the viewer, so concurrent requests do not overlap
+                "tid": zlib.crc32(str(trace_id).encode()) if trace_id else 0,
+                "args": {"trace_id": trace_id, **args},
+            }
+        )